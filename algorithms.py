@@ -0,0 +1,82 @@
+# algorithms.py v13
+import numpy as np
+from PIL import Image, JpegImagePlugin
+import config
+import pixel_shuffle
+
+class PixelShuffle:
+    """像素重排：按密码分别置换所有行与所有列"""
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def permutations(self, password: str, height: int, width: int, inverse: bool = False,
+                     stats: dict | None = None) -> tuple[np.ndarray, np.ndarray]:
+        """返回 (行置换, 列置换)；inverse=True 时返回解密用的逆置换"""
+        return pixel_shuffle.image_permutations(password, height, width, inverse, stats)
+
+    def save_params(self, image: Image.Image) -> dict:
+        """保存结果时附加的编码参数"""
+        return {}
+
+class BlockShuffle:
+    """
+    分块重排：以对齐的 block×block 块为单位置换块行与块列，块内像素保持不动。
+    置换长度只有像素重排的 1/block，且不破坏 JPEG 的 8×8 DCT 块（16 对应 4:2:0 的宏块），
+    按原量化表重新编码时文件大小与编码耗时接近原图。
+    宽高不足一个整块的边缘行列保持原位。
+    """
+
+    def __init__(self, name: str, block: int):
+        self.name = name
+        self.block = block
+
+    def _axis(self, password: str, axis: str, length: int, inverse: bool,
+              stats: dict | None) -> np.ndarray:
+        """将块级置换展开为像素级下标"""
+        b = self.block
+        blocks = length // b
+        # 以块大小区分密钥，避免与像素重排共用同一置换
+        perm, inv = pixel_shuffle.get_permutation(f"block{b}:{password}", axis, blocks, stats)
+        block_perm = inv if inverse else perm
+        expanded = (block_perm[:, None] * b + np.arange(b, dtype=np.intp)).ravel()
+        return np.concatenate([expanded, np.arange(blocks * b, length, dtype=np.intp)])
+
+    def permutations(self, password: str, height: int, width: int, inverse: bool = False,
+                     stats: dict | None = None) -> tuple[np.ndarray, np.ndarray]:
+        """返回 (行置换, 列置换)；inverse=True 时返回解密用的逆置换"""
+        return (self._axis(password, 'y', height, inverse, stats),
+                self._axis(password, 'x', width, inverse, stats))
+
+    def save_params(self, image: Image.Image) -> dict:
+        """JPEG 沿用原图的量化表与色度抽样，使块对齐的重排结果尽量保持原有大小与画质"""
+        if image.format != "JPEG" or not getattr(image, "quantization", None):
+            return {}
+        params = {"qtables": image.quantization}
+        subsampling = JpegImagePlugin.get_sampling(image)
+        if subsampling != -1:
+            params["subsampling"] = subsampling
+        return params
+
+_REGISTRY: dict = {}
+
+def register(algorithm):
+    """注册加密算法，名称须在 config.ENCRYPTION_ALGORITHMS 中声明"""
+    if algorithm.name not in config.ENCRYPTION_ALGORITHMS:
+        raise ValueError(f"未在配置中声明的加密算法: {algorithm.name}")
+    _REGISTRY[algorithm.name] = algorithm
+
+def get_algorithm(name: str):
+    """按名称获取已注册的算法"""
+    try:
+        return _REGISTRY[name]
+    except KeyError:
+        raise ValueError(f"未知的加密算法: {name}") from None
+
+def available() -> dict[str, str]:
+    """已注册算法的 名称 -> 描述"""
+    return {name: config.ENCRYPTION_ALGORITHMS[name] for name in _REGISTRY}
+
+register(PixelShuffle('PIXEL_SHUFFLE'))
+register(BlockShuffle('BLOCK_SHUFFLE', 16))
+register(BlockShuffle('BLOCK_SHUFFLE_8', 8))
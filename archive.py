@@ -0,0 +1,179 @@
+# archive.py v13
+import io
+import os
+import posixpath
+import tarfile
+import threading
+import time
+import zipfile
+from typing import BinaryIO, Iterator, Optional
+import config
+
+# 本身已压缩的图片格式，以及置换后近似噪声的像素容器，在 zip 中直接存储，再压缩只会浪费CPU
+_STORED_FORMATS = {".jpg", ".jpeg", ".png", ".gif", ".webp", config.CONTAINER_EXTENSION}
+
+def is_archive(path: str) -> bool:
+    """按扩展名判断是否为支持的压缩包"""
+    return path.lower().endswith(tuple(config.ARCHIVE_FORMATS))
+
+def _tar_mode(path: str, write: bool) -> str:
+    lower = path.lower()
+    if not write:
+        return "r:*"
+    if lower.endswith((".tar.gz", ".tgz")):
+        return "w:gz"
+    return "w"
+
+def _is_image(name: str) -> bool:
+    """跳过目录、隐藏文件与 macOS 打包时附带的 __MACOSX/._* 资源文件"""
+    base = posixpath.basename(name)
+    if not base or base.startswith(".") or name.startswith("__MACOSX/"):
+        return False
+    return os.path.splitext(base)[1].lower() in config.ENCRYPTED_EXTENSION
+
+class ArchiveReader:
+    """
+    按成员顺序流式读取压缩包中的图片，每次只在内存中保留一个成员的压缩数据
+    names / sizes 为图片成员名与成员头中记录的解压后大小，不需解压即可得到
+    fileobj 不为空时从该文件对象（如请求体的 BytesIO）读取，path 只用于按扩展名判断格式
+    """
+
+    def __init__(self, path: str, fileobj: Optional[BinaryIO] = None):
+        self.path = path
+        self._zip = None
+        self._tar = None
+        if path.lower().endswith(".zip"):
+            self._zip = zipfile.ZipFile(fileobj if fileobj is not None else path)
+            infos = [info for info in self._zip.infolist() if not info.is_dir() and _is_image(info.filename)]
+            self.names = [info.filename for info in infos]
+            self.sizes = [info.file_size for info in infos]
+        else:
+            self._tar = tarfile.open(path if fileobj is None else None, _tar_mode(path, False), fileobj=fileobj)
+            self._members = [m for m in self._tar.getmembers() if m.isfile() and _is_image(m.name)]
+            self.names = [m.name for m in self._members]
+            self.sizes = [m.size for m in self._members]
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __iter__(self) -> Iterator[tuple[str, bytes]]:
+        """依次返回 (成员名, 文件内容)"""
+        if self._zip is not None:
+            for name in self.names:
+                yield name, self._zip.read(name)
+        else:
+            for member in self._members:
+                f = self._tar.extractfile(member)
+                yield member.name, f.read()
+
+    def head(self, index: int, size: int) -> bytes:
+        """第 index 个成员开头的至多 size 字节，只解压这一部分（用于读取图片文件头）"""
+        if self._zip is not None:
+            with self._zip.open(self.names[index]) as f:
+                return f.read(size)
+        return self._tar.extractfile(self._members[index]).read(size)
+
+    def close(self):
+        if self._zip is not None:
+            self._zip.close()
+        if self._tar is not None:
+            self._tar.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class ArchiveWriter:
+    """
+    线程安全地向 zip/tar 追加成员：编码在调用线程中完成，只有写入压缩包时串行。
+    成员重名时追加序号，返回实际写入的成员名。
+    内容先写入同目录下的临时文件，close 时原子替换为目标路径；abort 或异常退出时删除临时文件。
+    fileobj 不为空时直接写入该文件对象（如内存中的 BytesIO），不产生任何文件，path 只用于判断格式。
+    """
+
+    def __init__(self, path: str, fileobj: Optional[BinaryIO] = None):
+        self.path = path
+        self._tmp_path = None
+        if fileobj is None:
+            directory = os.path.dirname(os.path.abspath(path))
+            os.makedirs(directory, exist_ok=True)
+            self._tmp_path = os.path.join(directory, f".{os.path.basename(path)}.{os.urandom(4).hex()}.part")
+            fileobj = open(self._tmp_path, "wb")
+        self._file = fileobj
+        self._zip = None
+        self._tar = None
+        if path.lower().endswith(".zip"):
+            self._zip = zipfile.ZipFile(fileobj, "w")
+        else:
+            self._tar = tarfile.open(mode=_tar_mode(path, True), fileobj=fileobj)
+        self._closed = False
+        self._names: set[str] = set()
+        self._lock = threading.Lock()
+
+    def _unique(self, name: str) -> str:
+        stem, ext = posixpath.splitext(name)
+        candidate, n = name, 1
+        while candidate in self._names:
+            candidate = f"{stem}_{n}{ext}"
+            n += 1
+        self._names.add(candidate)
+        return candidate
+
+    def add(self, name: str, data: bytes) -> str:
+        """写入一个成员，返回实际成员名"""
+        with self._lock:
+            name = self._unique(name)
+            if self._zip is not None:
+                ext = posixpath.splitext(name)[1].lower()
+                compress = zipfile.ZIP_STORED if ext in _STORED_FORMATS else zipfile.ZIP_DEFLATED
+                self._zip.writestr(name, data, compress_type=compress)
+            else:
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                info.mtime = int(time.time())
+                self._tar.addfile(info, io.BytesIO(data))
+            return name
+
+    def _close_archive(self) -> bool:
+        """关闭底层压缩包；已关闭时返回 False"""
+        if self._closed:
+            return False
+        self._closed = True
+        try:
+            if self._zip is not None:
+                self._zip.close()
+            if self._tar is not None:
+                self._tar.close()
+        finally:
+            if self._tmp_path is not None:
+                self._file.close()
+        return True
+
+    def close(self):
+        """写完压缩包并替换到目标路径"""
+        with self._lock:
+            if self._close_archive() and self._tmp_path is not None:
+                os.replace(self._tmp_path, self.path)
+
+    def abort(self):
+        """放弃写入：删除临时文件，不生成目标压缩包"""
+        with self._lock:
+            try:
+                self._close_archive()
+            finally:
+                if self._tmp_path is not None:
+                    try:
+                        os.remove(self._tmp_path)
+                    except OSError:
+                        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
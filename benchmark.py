@@ -0,0 +1,336 @@
+# benchmark.py v13
+"""
+性能基准：在本地生成合成图片，分别测量密钥派生、置换生成、gather、解码、编码各阶段，
+各输出编码配置的编码耗时与大小，以及 ImageCrypto 单张与批量处理的吞吐量（MP/s、files/s）和峰值常驻内存（Linux），结果以JSON输出，便于跨提交对比。
+
+示例:
+    python benchmark.py                                  # 默认尺寸/模式/格式
+    python benchmark.py --sizes thumb 12mp 100mp --formats png tiff -o bench.json
+    python benchmark.py --batch-files 64 --batch-workers 1 4 --pipeline
+    python benchmark.py --sizes 12mp --formats png webp --profiles fastest smallest --batch-files 0
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+import config
+import crypto_core
+import encoders
+import keytag
+import pixel_shuffle
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# 尺寸名 -> (宽, 高)
+SIZES = {
+    "thumb": (256, 256),
+    "1mp": (1280, 800),
+    "12mp": (4000, 3000),
+    "33mp": (7680, 4320),
+    "50mp": (8660, 5773),
+    "100mp": (12247, 8165),
+}
+DEFAULT_SIZES = ["thumb", "1mp", "12mp"]
+MODES = ["RGB", "RGBA", "L", "P"]
+FORMATS = {"png": "PNG", "jpeg": "JPEG", "webp": "WEBP", "tiff": "TIFF"}
+# 各格式能原样保存的模式
+FORMAT_MODES = {
+    "PNG": {"RGB", "RGBA", "L", "P"},
+    "JPEG": {"RGB", "L"},
+    "WEBP": {"RGB", "RGBA"},
+    "TIFF": {"RGB", "RGBA", "L", "P"},
+}
+PASSWORD = "Bench1234Key"
+
+def synth_image(width: int, height: int, mode: str, seed: int = 0) -> Image.Image:
+    """生成带渐变和噪声的合成图片，压缩特性接近照片"""
+    rng = np.random.default_rng(seed)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    x = np.linspace(0, 255, width, dtype=np.float32)[None, :]
+    base = np.empty((height, width, 3), dtype=np.uint8)
+    for c, (fx, fy) in enumerate([(0.7, 0.3), (0.2, 0.8), (0.5, 0.5)]):
+        noise = rng.integers(0, 24, size=(height, width), dtype=np.uint8)
+        base[..., c] = (x * fx + y * fy).astype(np.uint8) + noise
+    img = Image.fromarray(base)
+    if mode == "P":
+        return img.quantize(colors=256)
+    return img.convert(mode)
+
+def timed(fn, repeat: int) -> tuple[float, object]:
+    """执行 repeat 次，返回 (中位数耗时秒, 最后一次结果)"""
+    times = []
+    result = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - t0)
+    return statistics.median(times), result
+
+def _rss_kb() -> dict[str, int]:
+    """/proc/self/status 中的当前常驻内存 VmRSS 与峰值 VmHWM（KB）"""
+    values = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            if key in ("VmRSS", "VmHWM"):
+                values[key] = int(value.split()[0])
+    return values
+
+def peak_rss_bytes(fn) -> int | None:
+    """
+    一次调用期间常驻内存（RSS）峰值比调用前高出的字节数，包含 Pillow 解码/编码缓冲区等原生分配，
+    tracemalloc 只跟踪 Python 堆，看不到这些。
+    调用前写 /proc/self/clear_refs 把进程的峰值重置为当前值，仅 Linux 支持，其他平台返回 None。
+    之前释放但仍驻留在分配器中的内存被复用时不计入，结果可能略低于实际需要的内存
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        before = _rss_kb()["VmRSS"]
+    except OSError:
+        return None
+    fn()
+    return max(0, _rss_kb()["VmHWM"] - before) * 1024
+
+def bench_stages(width: int, height: int, mode: str, fmt: str, repeat: int) -> dict:
+    """单张图片的分阶段计时"""
+    mp = width * height / 1e6
+    img = synth_image(width, height, mode)
+    src = np.asarray(img)
+    out = np.empty_like(src)
+    digest = pixel_shuffle.get_sha256(PASSWORD)
+
+    # 置换种子的哈希链加上密钥校验标签的 PBKDF2；_check_key 在进程内有缓存，绕过缓存测每次的实际派生
+    t_key, _ = timed(lambda: (pixel_shuffle.get_sha256(pixel_shuffle.get_sha256(PASSWORD)),
+                              keytag._check_key.__wrapped__(PASSWORD)), repeat)
+    t_perm, _ = timed(lambda: (pixel_shuffle.build_permutation(digest, width),
+                               pixel_shuffle.build_permutation(pixel_shuffle.get_sha256(digest), height)),
+                      repeat)
+    pixel_shuffle.clear_permutation_cache()
+    t_gather, _ = timed(lambda: pixel_shuffle.encrypt_array(src, PASSWORD, out=out), repeat)
+    # 按CPU核心数分行带的多线程 gather；小图不拆分，与单线程相同
+    rows, cols = pixel_shuffle.image_permutations(PASSWORD, height, width)
+    threads = pixel_shuffle.gather_threads(out.nbytes, 0)
+    t_gather_mt, _ = timed(lambda: pixel_shuffle.permute_array(src, rows, cols, out=out, threads=0), repeat)
+    # 编码与解码的对象是置换后的图片：像素打乱后压缩率与编码耗时都与原图不同
+    shuffled = pixel_shuffle.to_image(out, img)
+
+    def encode():
+        buf = io.BytesIO()
+        shuffled.save(buf, format=fmt)
+        return buf.getvalue()
+
+    t_encode, data = timed(encode, repeat)
+
+    def decode():
+        with Image.open(io.BytesIO(data)) as im:
+            return np.asarray(im)
+
+    t_decode, _ = timed(decode, repeat)
+    return {
+        "width": width,
+        "height": height,
+        "megapixels": round(mp, 3),
+        "mode": mode,
+        "format": fmt,
+        "encoded_bytes": len(data),
+        "gather_threads": threads,
+        "seconds": {
+            "key_derivation": t_key,
+            "permutation": t_perm,
+            "gather": t_gather,
+            "gather_threaded": t_gather_mt,
+            "decode": t_decode,
+            "encode": t_encode,
+        },
+        "mp_per_s": {
+            "gather": mp / t_gather if t_gather else None,
+            "gather_threaded": mp / t_gather_mt if t_gather_mt else None,
+            "decode": mp / t_decode if t_decode else None,
+            "encode": mp / t_encode if t_encode else None,
+        },
+        "peak_rss_bytes": {
+            "gather": peak_rss_bytes(lambda: pixel_shuffle.encrypt_array(src, PASSWORD)),
+            "decode": peak_rss_bytes(decode),
+        },
+    }
+
+def bench_encoders(width: int, height: int, mode: str, fmt: str, repeat: int,
+                   profiles: list[str]) -> list[dict]:
+    """各编码配置保存置换后图片的耗时与大小，exact 表示解码后像素与置换结果逐一相同（有损格式为 False）"""
+    img = synth_image(width, height, mode)
+    shuffled_arr = pixel_shuffle.encrypt_array(np.asarray(img), PASSWORD)
+    shuffled = pixel_shuffle.to_image(shuffled_arr, img)
+    mp = width * height / 1e6
+    results = []
+    for profile in profiles:
+        for lossless in (False, True):
+            out_fmt = encoders.output_format(fmt, lossless)
+            params = encoders.save_params(out_fmt, profile, lossless)
+            if lossless and out_fmt == fmt and not params.get("lossless"):
+                # 本身无损的格式强制无损没有区别
+                continue
+
+            def encode():
+                buf = io.BytesIO()
+                shuffled.save(buf, format=out_fmt, **params)
+                return buf
+
+            t_encode, buf = timed(encode, repeat)
+            buf.seek(0)
+            with Image.open(buf) as im:
+                exact = np.array_equal(np.asarray(im), shuffled_arr)
+            results.append({
+                "width": width,
+                "height": height,
+                "mode": mode,
+                "format": fmt,
+                "output_format": out_fmt,
+                "profile": profile,
+                "lossless": lossless,
+                "encode_seconds": t_encode,
+                "encode_mp_per_s": mp / t_encode if t_encode else None,
+                "encoded_bytes": buf.getbuffer().nbytes,
+                "exact": exact,
+            })
+    return results
+
+def bench_single(width: int, height: int, mode: str, fmt: str, repeat: int, work_dir: str) -> dict:
+    """ImageCrypto.encrypt_image / decrypt_image 端到端计时"""
+    ext = "." + ("tiff" if fmt == "TIFF" else fmt.lower())
+    path = os.path.join(work_dir, f"single_{width}x{height}_{mode}{ext}")
+    synth_image(width, height, mode).save(path, format=fmt)
+    crypto = crypto_core.ImageCrypto()
+    out_dir = os.path.join(work_dir, "single_out")
+    t_enc, (ok, msg) = timed(lambda: crypto.encrypt_image(path, out_dir, PASSWORD), repeat)
+    enc_path = msg.split(" -> ")[-1] if ok else None
+    t_dec = None
+    if enc_path:
+        t_dec, _ = timed(lambda: crypto.decrypt_image(enc_path, out_dir, PASSWORD), repeat)
+    mp = width * height / 1e6
+    return {
+        "width": width,
+        "height": height,
+        "mode": mode,
+        "format": fmt,
+        "ok": ok,
+        "encrypt_seconds": t_enc,
+        "decrypt_seconds": t_dec,
+        "encrypt_mp_per_s": mp / t_enc if t_enc else None,
+        "peak_rss_bytes": peak_rss_bytes(lambda: crypto.encrypt_image(path, out_dir, PASSWORD)),
+    }
+
+def bench_batch(files: int, size: str, fmt: str, workers: int, pipeline: bool, work_dir: str) -> dict:
+    """批量加密吞吐量"""
+    width, height = SIZES[size]
+    ext = "." + ("tiff" if fmt == "TIFF" else fmt.lower())
+    in_dir = os.path.join(work_dir, f"batch_in_{size}_{fmt}")
+    if not os.path.isdir(in_dir):
+        os.makedirs(in_dir)
+        for i in range(files):
+            synth_image(width, height, "RGB", seed=i).save(os.path.join(in_dir, f"{i:05d}{ext}"), format=fmt)
+    paths = sorted(os.path.join(in_dir, f) for f in os.listdir(in_dir))[:files]
+    out_dir = tempfile.mkdtemp(dir=work_dir)
+    crypto = crypto_core.ImageCrypto()
+    t0 = time.perf_counter()
+    ok, msg, failed = crypto.batch_encrypt(paths, out_dir, PASSWORD, workers=workers, pipeline=pipeline)
+    elapsed = time.perf_counter() - t0
+    shutil.rmtree(out_dir, ignore_errors=True)
+    mp = width * height * len(paths) / 1e6
+    return {
+        "files": len(paths),
+        "size": size,
+        "format": fmt,
+        "workers": workers,
+        "pipeline": pipeline,
+        "ok": ok and not failed,
+        "seconds": elapsed,
+        "files_per_s": len(paths) / elapsed,
+        "mp_per_s": mp / elapsed,
+    }
+
+def environment() -> dict:
+    """记录运行环境，便于跨提交比较"""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=config.BASE_DIR,
+                                capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pillow": Image.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="图片加解密性能基准")
+    parser.add_argument("--sizes", nargs="+", choices=list(SIZES), default=DEFAULT_SIZES)
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=MODES)
+    parser.add_argument("--formats", nargs="+", choices=list(FORMATS), default=list(FORMATS))
+    parser.add_argument("--profiles", nargs="+", choices=list(config.ENCODER_PROFILES),
+                        default=list(config.ENCODER_PROFILES), help="参与对比的输出编码配置")
+    parser.add_argument("--repeat", type=int, default=3, help="每项重复次数，取中位数")
+    parser.add_argument("--batch-files", type=int, default=32, help="批量测试的文件数，0 表示跳过")
+    parser.add_argument("--batch-size", choices=list(SIZES), default="1mp")
+    parser.add_argument("--batch-workers", nargs="+", type=int, default=[1, os.cpu_count() or 1])
+    parser.add_argument("--pipeline", action="store_true", help="批量测试额外运行流水线模式")
+    parser.add_argument("-o", "--output", help="结果JSON文件，默认输出到标准输出")
+    return parser
+
+def main(argv: list[str] | None = None) -> int:
+    args = build_parser().parse_args(argv)
+    results = {"environment": environment(), "stages": [], "encoders": [], "single": [], "batch": []}
+    work_dir = tempfile.mkdtemp(prefix="img_crypto_bench_")
+    try:
+        for size in args.sizes:
+            width, height = SIZES[size]
+            for fmt_name in args.formats:
+                fmt = FORMATS[fmt_name]
+                for mode in args.modes:
+                    if mode not in FORMAT_MODES[fmt]:
+                        continue
+                    print(f"stages {size} {mode} {fmt}", file=sys.stderr)
+                    results["stages"].append(bench_stages(width, height, mode, fmt, args.repeat))
+                    results["encoders"].extend(bench_encoders(width, height, mode, fmt, args.repeat, args.profiles))
+                    results["single"].append(bench_single(width, height, mode, fmt, args.repeat, work_dir))
+        if args.batch_files > 0:
+            for fmt_name in args.formats:
+                for workers in sorted(set(args.batch_workers)):
+                    for pipeline in ([False, True] if args.pipeline else [False]):
+                        print(f"batch {fmt_name} workers={workers} pipeline={pipeline}", file=sys.stderr)
+                        results["batch"].append(bench_batch(args.batch_files, args.batch_size,
+                                                            FORMATS[fmt_name], workers, pipeline, work_dir))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    if resource is not None:
+        # Linux 上 ru_maxrss 单位为KB，macOS 为字节
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        results["environment"]["max_rss_bytes"] = maxrss if sys.platform == "darwin" else maxrss * 1024
+    text = json.dumps(results, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,177 @@
+# cli.py v13
+"""
+命令行批量加解密入口，直接调用 crypto_core.ImageCrypto，不导入 gradio/tkinter。
+numpy/PIL 等重依赖与日志初始化均在参数解析之后按需导入，--help 与参数错误可立即返回。
+
+示例:
+    IMAGE_CRYPTO_PASSWORD=Abcdef12 python cli.py encrypt photos/ -o out/ --workers 8
+    python cli.py decrypt out/ -o restored/ --password-file key.txt
+    python cli.py rekey out/ -o rekeyed/ --password-file old.txt --new-password-file new.txt
+    python cli.py encrypt photos.zip -o encrypted.zip -w 4
+每个文件输出一行JSON结果，最后输出一行汇总。
+"""
+import argparse
+import json
+import os
+import signal
+import sys
+
+import config
+
+DEFAULT_PASSWORD_ENV = "IMAGE_CRYPTO_PASSWORD"
+DEFAULT_NEW_PASSWORD_ENV = "IMAGE_CRYPTO_NEW_PASSWORD"
+
+def collect_images(inputs: list[str]) -> tuple[list[str], dict[str, str]]:
+    """
+    展开输入：文件原样保留，目录递归查找受支持格式的图片。
+    返回 (文件列表, 文件 → 相对其输入目录的子目录)，输出时按子目录还原目录层级
+    """
+    paths, subdirs = [], {}
+    for item in inputs:
+        if os.path.isdir(item):
+            for root, dirs, files in os.walk(item):
+                dirs.sort()
+                rel = os.path.relpath(root, item)
+                for name in sorted(files):
+                    if os.path.splitext(name)[1].lower() in config.ENCRYPTED_EXTENSION:
+                        path = os.path.join(root, name)
+                        paths.append(path)
+                        if rel != os.curdir:
+                            subdirs[path] = rel
+        else:
+            paths.append(item)
+    return paths, subdirs
+
+def read_password(password_file: str | None, password_env: str) -> str:
+    """从密码文件（首行）或环境变量读取密码"""
+    if password_file:
+        with open(password_file, encoding="utf-8") as f:
+            return f.readline().rstrip("\r\n")
+    return os.environ.get(password_env, "")
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="image_crypto", description="图片像素重排批量加密/解密")
+    parser.add_argument("operation", choices=["encrypt", "decrypt", "rekey"],
+                        help="操作类型；rekey 将加密图片直接换成新密码")
+    parser.add_argument("inputs", nargs="+", help="图片文件、zip/tar 压缩包或目录（目录递归查找图片）")
+    parser.add_argument("-o", "--output-dir", required=True,
+                        help="输出目录；以 .zip/.tar/.tar.gz/.tgz 结尾时结果写入单个压缩包")
+    parser.add_argument("-w", "--workers", type=int, default=1,
+                        help="并行进程数，<=0 表示使用全部CPU核心（默认1）")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="使用 解码→置换→编码 流水线，workers 为解码/编码线程数")
+    parser.add_argument("-a", "--algorithm", choices=list(config.ENCRYPTION_ALGORITHMS),
+                        default=config.DEFAULT_ALGORITHM, help="加密算法，解密时须与加密时一致")
+    parser.add_argument("-p", "--profile", choices=list(config.ENCODER_PROFILES),
+                        default=config.DEFAULT_ENCODER_PROFILE, help="输出编码配置：fastest/balanced/smallest")
+    parser.add_argument("--lossless", action="store_true",
+                        help="强制无损输出：JPEG 改存为 PNG，WebP 使用无损模式")
+    parser.add_argument("--container", action="store_true",
+                        help="加密/换密结果存为原始像素容器 .icr：不经编解码，解密时内存映射，往返逐字节一致")
+    parser.add_argument("--memory-budget", type=int, metavar="MB",
+                        help=f"并行/流水线在途作业的预计内存上限（默认 {config.BATCH_MEMORY_BUDGET // 2**20} MB）")
+    parser.add_argument("--gather-threads", type=int, default=config.GATHER_THREADS, metavar="N",
+                        help="单张大图像素置换的线程数，0 为按CPU核心数（默认）；多进程模式下每个进程固定为1")
+    parser.add_argument("--incremental", action="store_true",
+                        help="增量模式：跳过输出目录清单中记录的、内容、密码与输出选项均未变化的文件")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--password-env", default=DEFAULT_PASSWORD_ENV,
+                        help=f"从环境变量读取密码（默认 {DEFAULT_PASSWORD_ENV}）")
+    source.add_argument("--password-file", help="从文件首行读取密码")
+    new_source = parser.add_mutually_exclusive_group()
+    new_source.add_argument("--new-password-env", default=DEFAULT_NEW_PASSWORD_ENV,
+                            help=f"rekey 的新密码环境变量（默认 {DEFAULT_NEW_PASSWORD_ENV}）")
+    new_source.add_argument("--new-password-file", help="rekey 的新密码文件（首行）")
+    parser.add_argument("-v", "--verbose", action="store_true", help="输出日志到 logs 目录与标准错误")
+    return parser
+
+def emit(record: dict):
+    """输出一行JSON结果"""
+    sys.stdout.write(json.dumps(record, ensure_ascii=False) + "\n")
+    sys.stdout.flush()
+
+def main(argv: list[str] | None = None) -> int:
+    """返回退出码：0 全部成功，1 部分失败，2 参数错误，3 密钥校验未通过而中止，4 写入输出失败，130 被 Ctrl+C 取消"""
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    try:
+        password = read_password(args.password_file, args.password_env)
+        new_password = None
+        if args.operation == "rekey":
+            new_password = read_password(args.new_password_file, args.new_password_env)
+    except OSError as e:
+        parser.error(f"读取密码文件失败: {e}")
+    if not password:
+        parser.error("未提供密码：请设置环境变量或使用 --password-file")
+    if args.operation == "rekey" and not new_password:
+        parser.error("未提供新密码：请设置环境变量或使用 --new-password-file")
+
+    import utils
+    if args.operation != "decrypt":
+        is_valid, msg = utils.validate_password(new_password or password)
+        if not is_valid:
+            parser.error(msg)
+    if args.verbose:
+        utils.setup_logging()
+
+    paths, subdirs = collect_images(args.inputs)
+    if not paths:
+        parser.error("未找到可处理的图片")
+
+    import archive
+    to_archive = archive.is_archive(args.output_dir)
+    if not to_archive and any(archive.is_archive(p) for p in paths):
+        parser.error("输入包含压缩包时，-o 须为 .zip/.tar/.tar.gz/.tgz 输出路径")
+    if to_archive and (args.pipeline or args.incremental):
+        parser.error("输出为压缩包时不支持 --pipeline/--incremental（workers>1 时自动使用流水线）")
+
+    import crypto_core
+    crypto = crypto_core.ImageCrypto(args.algorithm, args.profile, args.lossless, args.container)
+    if args.memory_budget:
+        crypto.memory_budget = args.memory_budget * 2**20
+    crypto.gather_threads = args.gather_threads
+    # 指标回调先于结果回调触发，暂存后并入同一行输出
+    latest = {}
+    crypto.set_metrics_callback(lambda m, batch_metrics: latest.update(metrics=m.to_dict()))
+    crypto.set_result_callback(
+        lambda path, success, msg, out_path: emit(
+            {"input": path, "ok": success, "output": out_path, "message": msg,
+             "metrics": latest.pop("metrics", None)}))
+    interrupted = []
+
+    def on_sigint(signum, frame):
+        interrupted.append(signum)
+        crypto.stop_operations()
+
+    signal.signal(signal.SIGINT, on_sigint)
+
+    options = dict(workers=args.workers, pipeline=args.pipeline, incremental=args.incremental, subdirs=subdirs)
+    if to_archive:
+        if args.operation == "rekey":
+            completed, msg, failed = crypto.batch_rekey_archive(paths, args.output_dir, password, new_password,
+                                                                args.workers)
+        elif args.operation == "encrypt":
+            completed, msg, failed = crypto.batch_encrypt_archive(paths, args.output_dir, password, args.workers)
+        else:
+            completed, msg, failed = crypto.batch_decrypt_archive(paths, args.output_dir, password, args.workers)
+    elif args.operation == "rekey":
+        completed, msg, failed = crypto.batch_rekey(paths, args.output_dir, password, new_password, **options)
+    elif args.operation == "encrypt":
+        completed, msg, failed = crypto.batch_encrypt(paths, args.output_dir, password, **options)
+    else:
+        completed, msg, failed = crypto.batch_decrypt(paths, args.output_dir, password, **options)
+    # 压缩包输入按成员计数
+    total = crypto.last_batch_metrics.total if to_archive and crypto.last_batch_metrics else len(paths)
+    emit({"summary": True, "completed": completed, "message": msg,
+          "total": total, "failed": len(failed), "profile": args.profile, "lossless": args.lossless,
+          "container": args.container,
+          "metrics": crypto.last_batch_metrics.summary() if crypto.last_batch_metrics else None})
+    if not completed:
+        # 未完成的批次区分用户中断、密钥校验中止与输出（压缩包）写入失败，便于脚本分别处理
+        if interrupted:
+            return 130
+        return 3 if crypto.abort_message else 4
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -8,14 +8,93 @@ UI_DESCRIPTION = (
     "一个简单、安全的图片像素重排加密/解密工具，直接操作图像像素，保持图像格式不变，但使内容无法识别。"
 )
 UI_THEME = "default"
+# 界面同时运行的批处理数（超出的请求在队列中等待）、进度推送间隔（秒）与信息框中保留的失败消息条数
+UI_CONCURRENCY_LIMIT = 2
+UI_REFRESH_INTERVAL = 0.25
+UI_ERROR_LINES = 5
+# 处理过程中结果文件框只推送最近完成的若干个文件（有新文件时），结束时推送全部，每次刷新的数据量不随批次增长
+UI_RECENT_OUTPUTS = 20
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 TEMP_DIR = os.path.join(BASE_DIR, "temp")
+# 界面未指定输出目录时，结果存放在 TEMP_DIR 下每次操作独立的作业目录中；
+# 已完成作业的总字节数超过配额、或超过存放时长（秒）后按完成先后顺序删除，<=0 表示不限制
+RESULT_QUOTA_BYTES = 2 * 1024 * 1024 * 1024
+RESULT_MAX_AGE = 24 * 3600
+# 后台清理线程按存放时长检查的间隔（秒）
+RESULT_CLEANUP_INTERVAL = 300
 LOG_LEVEL = "INFO"
 
 SUPPORTED_FORMATS = [".jpg", ".jpeg", ".png", ".bmp", ".gif", ".tiff", ".webp"]
-ENCRYPTED_EXTENSION = SUPPORTED_FORMATS  # 保持原格式
+# 原始像素容器：文件头加未压缩的像素数据，解密时内存映射、不经编解码
+CONTAINER_EXTENSION = ".icr"
+ENCRYPTED_EXTENSION = SUPPORTED_FORMATS + [CONTAINER_EXTENSION]  # 保持原格式，或存为像素容器
+# 批处理可直接读写的压缩包格式
+ARCHIVE_FORMATS = [".zip", ".tar", ".tar.gz", ".tgz"]
+
+# 置换缓存条目上限（每个条目为某密码在某轴、某长度下的置换及其逆置换）
+PERM_CACHE_SIZE = 64
+# gather内核中单个行带的目标字节数，以及批处理中保留的空闲输出缓冲区个数
+GATHER_BAND_BYTES = 64 * 1024
+BUFFER_POOL_SIZE = 2
+# 单张图片 gather 的线程数：0 表示按CPU核心数，1 为单线程；进程池工作进程内固定为1
+GATHER_THREADS = 0
+# 每个 gather 线程至少分到的输出字节数，小于该值的图片不拆分
+PARALLEL_GATHER_MIN_BYTES = 16 * 1024 * 1024
+# gather 每写出这么多输出字节检查一次取消请求，决定取消的响应延迟
+CANCEL_CHECK_BYTES = 4 * 1024 * 1024
+# 解码结果按该字节数的行带复制为数组，避免整幅中间副本
+READ_BAND_BYTES = 1024 * 1024
+# 流水线模式下每个级间队列的容量（在途图片数上限）
+PIPELINE_QUEUE_SIZE = 4
+# 像素数据超过该字节数的图片使用 TEMP_DIR 下的内存映射暂存文件分带处理，行带缓冲区不超过预算
+TILED_THRESHOLD_BYTES = 1024 * 1024 * 1024
+TILE_MEMORY_BUDGET = 256 * 1024 * 1024
+# 并行批处理的内存预算：在途作业的预计峰值内存之和不超过该值（按文件头估算，不解码）
+BATCH_MEMORY_BUDGET = 2 * 1024 * 1024 * 1024
+# 内存路径下单个作业的峰值内存约为解码字节数的倍数
+# （实测 RGB 约 2.4 倍：PIL 按每像素4字节保存 RGB 解码结果，读取阶段与像素数组短暂并存）
+JOB_MEMORY_FACTOR = 3
+# 剩余时间估计中每个文件的固定开销，折算为像素数（打开、写入等与尺寸无关的耗时）
+ETA_FILE_OVERHEAD_PIXELS = 250_000
+# 增量模式写在输出目录中的清单文件名
+MANIFEST_NAME = ".image_crypto_manifest.jsonl"
 
 ENCRYPTION_ALGORITHMS = {
-    'PIXEL_SHUFFLE': '像素重排加密'
+    'PIXEL_SHUFFLE': '像素重排加密',
+    'BLOCK_SHUFFLE': '分块重排加密（16×16，适合JPEG）',
+    'BLOCK_SHUFFLE_8': '分块重排加密（8×8）',
+}
+DEFAULT_ALGORITHM = 'PIXEL_SHUFFLE'
+
+# 输出编码配置：置换后的图片近似噪声，PNG/WebP/TIFF 编码往往是最慢的阶段
+ENCODER_PROFILES = {
+    'fastest': '最快：PNG 不压缩、WebP method 0、TIFF 不压缩，文件较大',
+    'balanced': '均衡：Pillow 默认参数（与旧版本输出一致）',
+    'smallest': '最小：PNG zlib 9 级、WebP method 6、TIFF deflate，编码最慢',
 }
+DEFAULT_ENCODER_PROFILE = 'balanced'
+
+# 密钥校验标签的 PBKDF2 迭代次数（每个进程每个密码只派生一次）
+KEY_CHECK_ITERATIONS = 100_000
+# 批次开头连续这么多个文件未通过密钥校验时中止批处理
+KEY_CHECK_ABORT_AFTER = 3
+
+# 界面快速预览的最长边（像素）
+PREVIEW_MAX_SIZE = 1024
+
+# 本地 HTTP 服务（server.py）：默认只监听本机回环地址；实例数为同时处理的请求数上限，0 表示按CPU核心数
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 8765
+SERVER_WORKERS = 0
+# 请求等待空闲实例或内存额度的最长秒数，超时返回 503；请求体大小上限
+SERVER_QUEUE_TIMEOUT = 30.0
+SERVER_MAX_BODY_BYTES = 512 * 1024 * 1024
+# 压缩包请求按成员头中记录的解压后大小限制单个成员与全部成员之和，超出时不解压、直接拒绝（防止压缩炸弹）；
+# 估算处理内存时每个成员只解压开头这么多字节读取图片文件头
+SERVER_MAX_MEMBER_BYTES = 256 * 1024 * 1024
+SERVER_MAX_UNPACKED_BYTES = 2 * 1024 * 1024 * 1024
+SERVER_PROBE_BYTES = 1024 * 1024
+# 同时保持的连接（处理线程）数上限，超出的连接直接返回 503；空闲连接的超时秒数，超时后关闭并释放线程
+SERVER_MAX_CONNECTIONS = 64
+SERVER_IDLE_TIMEOUT = 30.0
@@ -0,0 +1,134 @@
+# container.py v13
+import json
+import os
+import struct
+from typing import Optional
+import numpy as np
+from PIL import Image
+
+# 原始像素容器：定长前缀 | JSON 文件头 | 填充到 64 字节对齐 | C 顺序的原始像素数据
+# 前缀为 魔数(6字节) + 版本(uint16) + 文件头长度(uint32)，小端序
+FORMAT = "ICR"
+MAGIC = b"ICRAW\0"
+VERSION = 1
+_PREFIX = struct.Struct("<6sHI")
+_ALIGN = 64
+
+def is_container(path: str, data: Optional[bytes] = None) -> bool:
+    """按魔数判断是否为原始像素容器；data 不为空时检查内存中的内容"""
+    if data is not None:
+        return data[:len(MAGIC)] == MAGIC
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+def _encode_transparency(value):
+    # PNG 的 P 模式透明表为 bytes，JSON 无法直接表示
+    if isinstance(value, bytes):
+        return {"bytes": value.hex()}
+    if isinstance(value, tuple):
+        return list(value)
+    return value
+
+def _decode_transparency(value):
+    if isinstance(value, dict):
+        return bytes.fromhex(value["bytes"])
+    if isinstance(value, list):
+        return tuple(value)
+    return value
+
+def describe(like: Image.Image, fmt: str, ext: str, algorithm: str, tag: Optional[str],
+             durations: Optional[list[int]] = None, loop: Optional[int] = None) -> dict:
+    """
+    组装文件头中除形状与 dtype 以外的字段
+    参数:
+        like: 携带模式、调色板与透明色的图片（原图、分带结果或多帧模板）
+        fmt, ext: 原图格式与扩展名，解密时按其还原
+        algorithm, tag: 加密算法与密钥校验标签
+        durations, loop: 多帧图片的每帧时长与循环次数；静态图片为 None
+    """
+    meta = {"mode": like.mode, "format": fmt, "ext": ext, "algorithm": algorithm, "tag": tag}
+    if like.mode in ("P", "PA"):
+        meta["palette"] = like.getpalette()
+    if "transparency" in like.info:
+        meta["transparency"] = _encode_transparency(like.info["transparency"])
+    if durations is not None:
+        meta["durations"] = durations
+        meta["loop"] = loop
+    return meta
+
+def write(fp, arr: np.ndarray, meta: dict):
+    """将像素数组连同文件头写入文件路径或文件对象"""
+    header = json.dumps(dict(meta, shape=list(arr.shape), dtype=arr.dtype.str), ensure_ascii=False).encode("utf-8")
+    head = _PREFIX.pack(MAGIC, VERSION, len(header)) + header
+    head += b"\0" * (-len(head) % _ALIGN)
+    arr = np.ascontiguousarray(arr)
+    if isinstance(fp, str):
+        with open(fp, "wb") as f:
+            f.write(head)
+            f.write(arr.data)
+    else:
+        fp.write(head)
+        fp.write(arr.data)
+
+def read_header(source: "str | bytes") -> tuple[dict, int]:
+    """读取文件头，返回 (文件头, 像素数据偏移)；source 为文件路径或文件内容"""
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            prefix = f.read(_PREFIX.size)
+            magic, version, length = _unpack(prefix)
+            header = f.read(length)
+    else:
+        magic, version, length = _unpack(source[:_PREFIX.size])
+        header = source[_PREFIX.size:_PREFIX.size + length]
+    if len(header) != length:
+        raise ValueError("像素容器文件头不完整")
+    meta = json.loads(header.decode("utf-8"))
+    offset = _PREFIX.size + length
+    return meta, offset + (-offset % _ALIGN)
+
+def _unpack(prefix: bytes) -> tuple[bytes, int, int]:
+    if len(prefix) != _PREFIX.size or prefix[:len(MAGIC)] != MAGIC:
+        raise ValueError("不是有效的像素容器")
+    magic, version, length = _PREFIX.unpack(prefix)
+    if version != VERSION:
+        raise ValueError(f"不支持的像素容器版本: {version}")
+    return magic, version, length
+
+def load(source: "str | bytes") -> tuple[np.ndarray, dict]:
+    """
+    打开像素数据而不复制：文件以只读内存映射打开，只有实际访问到的行才会从磁盘读入；
+    source 为文件内容时直接在其上建立只读视图
+    """
+    meta, offset = read_header(source)
+    shape = tuple(meta["shape"])
+    dtype = np.dtype(meta["dtype"])
+    count = int(np.prod(shape, dtype=np.int64))
+    available = os.path.getsize(source) if isinstance(source, str) else len(source)
+    if available < offset + count * dtype.itemsize:
+        raise ValueError("像素容器数据不完整")
+    if isinstance(source, str):
+        # 空图片无法建立映射
+        if count == 0:
+            return np.empty(shape, dtype=dtype), meta
+        return np.memmap(source, dtype=dtype, mode="r", offset=offset, shape=shape), meta
+    return np.frombuffer(source, dtype=dtype, count=count, offset=offset).reshape(shape), meta
+
+def size(meta: dict) -> tuple[int, int]:
+    """图片的 (宽, 高)"""
+    shape = meta["shape"]
+    if "durations" in meta:
+        shape = shape[1:]
+    return shape[1], shape[0]
+
+def template(meta: dict) -> Image.Image:
+    """1x1 模板图片，携带模式、调色板、透明色与原图格式，供 pixel_shuffle.to_image 还原像素"""
+    img = Image.new(meta["mode"], (1, 1))
+    if "palette" in meta:
+        img.putpalette(meta["palette"])
+    if "transparency" in meta:
+        img.info["transparency"] = _decode_transparency(meta["transparency"])
+    img.format = meta["format"]
+    return img
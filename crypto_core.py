@@ -1,28 +1,194 @@
 
 # crypto_core.py v13
+import io
+import multiprocessing
 import os
+import posixpath
+import signal
+import tarfile
 import time
+import zipfile
 import logging
-from typing import Callable, Optional
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Callable, Iterable, Optional
+import numpy as np
 from PIL import Image, UnidentifiedImageError
+import algorithms
+import archive
 import config
+import container
+import encoders
+import frames
+import keytag
 import pixel_shuffle
+import scheduler
+import tiled
+from manifest import Manifest, key_fingerprint, source_stamp
+from metrics import BatchMetrics, FileMetrics
+from pipeline import run_pipeline
 
 logger = logging.getLogger("img-crypto")
 
+# 加解密使用单个密码；换密(rekey)使用 (旧密码, 新密码)
+_Key = str | tuple[str, str]
+
+class _Job:
+    """单个文件在 读取解码 → 像素置换 → 编码保存 各阶段之间传递的状态"""
+
+    def __init__(self, op: str, path: str, data: Optional[bytes] = None, reserved: int = 0, subdir: str = ""):
+        self.op = op
+        # 文件路径；来自压缩包时为成员名
+        self.path = path
+        # 输出目录下的相对子目录（递归输入目录时还原源文件的目录层级）
+        self.subdir = subdir
+        # 压缩包成员的文件内容；普通文件为 None，从 path 读取
+        self.data = data
+        self.img: Optional[Image.Image] = None
+        # 解码得到的像素数组；超大图片为 None，留到置换阶段分带解码
+        self.src: Optional[np.ndarray] = None
+        # 置换结果：缓冲池中的数组、分带组装的结果图片，或流式分带写成的结果文件路径
+        self.result: np.ndarray | Image.Image | str | None = None
+        self.out_path: Optional[str] = None
+        # 多帧图片（动图、多页TIFF）的帧信息；此时 src 为 (帧, 高, 宽[, 通道]) 数组
+        self.frames: Optional[frames.FrameSet] = None
+        # 输入为原始像素容器时的文件头；此时 img 为 1x1 模板图片，src 为文件的只读映射
+        self.container: Optional[dict] = None
+        # 图片的 (宽, 高)
+        self.size: tuple[int, int] = (0, 0)
+        # 准入时占用的内存预算额度，作业结束后归还
+        self.reserved = reserved
+        # 加密/换密结果中写入元数据的密钥校验标签
+        self.tag: Optional[str] = None
+        # 按原格式保存时算法附加的编码参数（如 JPEG 量化表），在原图释放前取得
+        self.format_params: dict = {}
+        # 增量模式下读取前取得的源文件大小、修改时间与内容哈希，成功后写入清单
+        self.stamp: Optional[dict] = None
+        # 处理中途响应了取消请求；此时不算失败，也不上报结果
+        self.cancelled = False
+        self.metrics = FileMetrics(path=path, op=op)
+        self.started = time.perf_counter()
+
 class ImageCrypto:
     """图片像素重排加密/解密批处理"""
 
-    def __init__(self):
+    def __init__(self, algorithm: str = config.DEFAULT_ALGORITHM,
+                 encoder_profile: str = config.DEFAULT_ENCODER_PROFILE, lossless: bool = False,
+                 container: bool = False):
+        # 加密算法，见 config.ENCRYPTION_ALGORITHMS
+        self._algorithm = algorithms.get_algorithm(algorithm)
+        # 输出编码配置（见 config.ENCODER_PROFILES）；lossless 时有损格式改存为无损格式
+        encoders.check_profile(encoder_profile)
+        self.encoder_profile = encoder_profile
+        self.lossless = lossless
+        # 加密/换密结果改存为原始像素容器（.icr），解密时直接映射文件、不经编解码
+        self.container = container
         # 状态回调函数，用于进度或状态更新
         self._status_callback: Optional[Callable[[str, int], None]] = None
-        # 停止操作标志
+        # 结果回调函数，批处理中每个文件结束时调用 (源路径, 是否成功, 消息, 输出路径)
+        self._result_callback: Optional[Callable[[str, bool, str, Optional[str]], None]] = None
+        # 停止操作标志；进程池运行期间同时置位跨进程事件，工作进程在阶段内检查
         self._stop_requested = False
+        self._stop_event = None
+        # 批处理中同尺寸图片复用的输出缓冲区
+        self._buffers = pixel_shuffle.BufferPool()
+        # 像素数据超过阈值的图片改用内存映射分带处理，峰值内存受预算限制
+        self.tile_threshold = config.TILED_THRESHOLD_BYTES
+        self.tile_budget = config.TILE_MEMORY_BUDGET
+        # 单张大图 gather 的线程数（0 为按CPU核心数）；进程池工作进程内为1，避免与进程并行叠加
+        self.gather_threads = config.GATHER_THREADS
+        # 并行/流水线批处理在途作业的预计内存上限
+        self.memory_budget = config.BATCH_MEMORY_BUDGET
+        # 当前批次按作业规模加权的进度与剩余时间估计
+        self._progress: Optional[scheduler.Progress] = None
+        # 增量模式下当前批次的清单及其 (操作, 密钥指纹, 输出选项)
+        self._manifest: Optional[Manifest] = None
+        self._manifest_key: tuple[str, str, str] = ("", "", "")
+        # 读取阶段是否计算源文件哈希（增量模式；进程池工作进程中由初始化参数设置）
+        self._stamp_sources = False
+        # 结构化指标回调 (单文件指标, 批次汇总)，与状态回调并存
+        self._metrics_callback: Optional[Callable[[FileMetrics, BatchMetrics], None]] = None
+        self._batch_metrics: Optional[BatchMetrics] = None
+        # 最近一次单张处理的指标与最近一个批次的汇总
+        self.last_metrics: Optional[FileMetrics] = None
+        self.last_batch_metrics: Optional[BatchMetrics] = None
+        # 批次开头被密钥校验拒绝的文件数、是否已有文件通过校验，以及中止批次的原因
+        self._key_rejected = 0
+        self._key_accepted = False
+        self._abort_message: Optional[str] = None
+
+    @property
+    def algorithm(self) -> str:
+        """当前使用的加密算法名称"""
+        return self._algorithm.name
+
+    @property
+    def abort_message(self) -> Optional[str]:
+        """最近一个批次被自动中止（如连续多个文件未通过密钥校验）的原因；正常结束或由用户取消时为 None"""
+        return self._abort_message
+
+    def set_algorithm(self, name: str):
+        """切换加密算法；解密时须与加密时使用同一算法"""
+        self._algorithm = algorithms.get_algorithm(name)
+
+    def set_encoder_profile(self, profile: str, lossless: bool = False, container: bool = False):
+        """
+        切换输出编码配置；lossless=True 时 JPEG 输出改存为 PNG、WebP 改用无损模式，
+        container=True 时加密/换密结果存为原始像素容器
+        """
+        encoders.check_profile(profile)
+        self.encoder_profile = profile
+        self.lossless = lossless
+        self.container = container
 
     def set_status_callback(self, callback: Callable[[str, int], None]):
         """设置状态回调函数"""
         self._status_callback = callback
 
+    def set_result_callback(self, callback: Callable[[str, bool, str, Optional[str]], None]):
+        """设置逐文件结果回调函数"""
+        self._result_callback = callback
+
+    def set_metrics_callback(self, callback: Callable[[FileMetrics, BatchMetrics], None]):
+        """设置结构化指标回调函数，批处理中每个文件结束时调用"""
+        self._metrics_callback = callback
+
+    def _report_result(self, path: str, success: bool, msg: str, out_path: Optional[str],
+                       metrics: Optional[FileMetrics] = None, stamp: Optional[dict] = None):
+        """
+        内部方法：上报单个文件的处理结果与指标；
+        增量模式下带有 stamp（读取阶段取得的源文件信息）的成功结果同时写入清单，跳过的文件不重复记录
+        """
+        if metrics is not None and self._batch_metrics is not None:
+            self._batch_metrics.add(metrics)
+            if self._metrics_callback:
+                self._metrics_callback(metrics, self._batch_metrics)
+            self._check_abort(metrics)
+        if self._manifest is not None and success and out_path is not None and stamp is not None:
+            try:
+                op, fingerprint, options = self._manifest_key
+                self._manifest.record(op, path, fingerprint, out_path, stamp, options)
+            except OSError as e:
+                logger.warning(f"写入增量清单失败: {path} - {e}")
+        if self._result_callback:
+            self._result_callback(path, success, msg, out_path)
+
+    def _check_abort(self, metrics: FileMetrics):
+        """批次开头连续多个文件都未通过密钥校验时中止批次，不再逐个处理注定失败的文件"""
+        if metrics.key_check == "ok":
+            self._key_accepted = True
+        elif metrics.key_check == "mismatch" and not self._key_accepted:
+            self._key_rejected += 1
+            if self._key_rejected >= config.KEY_CHECK_ABORT_AFTER and not self._stop_requested:
+                self._abort_message = f"密码错误：前 {self._key_rejected} 个文件均未通过密钥校验，已中止批处理"
+                self.stop_operations()
+
+    def _begin_batch(self):
+        """批次开始前重置取消标志与密钥校验计数"""
+        self._stop_requested = False
+        self._key_rejected = 0
+        self._key_accepted = False
+        self._abort_message = None
+
     def _update_status(self, msg: str, progress: int = -1):
         """内部方法：更新状态并记录日志"""
         if self._status_callback:
@@ -30,8 +196,17 @@ class ImageCrypto:
         logger.info(msg)
 
     def stop_operations(self):
-        """请求停止批量操作"""
+        """
+        请求停止批量操作：在途文件在解码/编码之间或 gather 的行带之间中止，
+        写到一半的输出文件被删除，已完成的文件保留
+        """
         self._stop_requested = True
+        if self._stop_event is not None:
+            self._stop_event.set()
+
+    def _should_stop(self) -> bool:
+        """是否已请求取消；供各阶段与 gather 内核轮询"""
+        return self._stop_requested or (self._stop_event is not None and self._stop_event.is_set())
 
     def encrypt_image(self, image_path: str, output_dir: str, password: str) -> tuple[bool, str]:
         """
@@ -43,31 +218,9 @@ class ImageCrypto:
         返回:
             (是否成功, 消息)
         """
-        try:
-            if not os.path.exists(image_path):
-                return False, f"文件不存在: {image_path}"
-            ext = os.path.splitext(image_path)[1].lower()
-            if ext not in config.SUPPORTED_FORMATS:
-                return False, f"不支持的文件类型: {ext}"
-            try:
-                img = Image.open(image_path)
-            except UnidentifiedImageError:
-                return False, f"无法识别的图片: {image_path}"
-            # 像素加密
-            arr = pixel_shuffle.encrypt_image(img, password)
-            if arr is None:
-                return False, f"像素重排加密失败: {image_path}"
-            # 构造输出文件名
-            out_name = os.path.splitext(os.path.basename(image_path))[0] + "_enc" + ext
-            os.makedirs(output_dir, exist_ok=True)
-            out_path = os.path.join(output_dir, out_name)
-            # 保存加密图片
-            Image.fromarray(arr).save(out_path, format=img.format or "PNG")
-            img.close()
-            return True, f"{image_path} -> {out_path}"
-        except Exception as e:
-            logger.error(f"加密失败: {e}")
-            return False, f"加密失败: {image_path} - {e}"
+        success, msg, job = self._process("encrypt", image_path, output_dir, password)
+        self.last_metrics = job.metrics
+        return success, msg
 
     def decrypt_image(self, enc_path: str, output_dir: str, password: str) -> tuple[bool, str]:
         """
@@ -79,74 +232,884 @@ class ImageCrypto:
         返回:
             (是否成功, 消息)
         """
+        success, msg, job = self._process("decrypt", enc_path, output_dir, password)
+        self.last_metrics = job.metrics
+        return success, msg
+
+    def _process(self, op: str, path: str, output_dir: str, password: _Key) -> tuple[bool, str, _Job]:
+        """处理单个文件，返回 (是否成功, 消息, 作业)"""
+        # 单文件操作不受上一批次遗留的取消标志影响
+        self._stop_requested = False
+        return self._run_job(_Job(op, path), output_dir, password)
+
+    def _run_job(self, job: _Job, output: "str | archive.ArchiveWriter | _MemoryOutput",
+                 password: _Key) -> tuple[bool, str, _Job]:
+        """依次执行 读取解码 → 像素置换 → 编码保存 三个阶段，返回 (是否成功, 消息, 作业)"""
         try:
-            if not os.path.exists(enc_path):
-                return False, f"文件不存在: {enc_path}"
+            self._read_stage(job, password)
+            self._permute_stage(job, password)
+            self._write_stage(job, output)
+            return True, f"{job.path} -> {job.out_path}", self._finish_job(job, True)
+        except pixel_shuffle.Cancelled:
+            job.cancelled = True
+            return False, "操作已取消", self._finish_job(job, False)
+        except Exception as e:
+            return False, self._failure_message(job.op, job.path, e), self._finish_job(job, False)
+
+    def _finish_job(self, job: _Job, success: bool) -> _Job:
+        """记录结果与总耗时，释放图片与中间数组引用"""
+        job.metrics.success = success
+        job.metrics.total_s = time.perf_counter() - job.started
+        job.img = job.src = job.result = job.frames = job.data = None
+        return job
+
+    def _failure_message(self, op: str, path: str, error: BaseException) -> str:
+        """阶段异常转为返回给调用方的消息"""
+        if isinstance(error, _StageError):
+            return str(error)
+        label = _OP_LABELS[op]
+        logger.error(f"{label}失败: {error}")
+        return f"{label}失败: {path} - {error}"
+
+    def _read_stage(self, job: _Job, password: _Key) -> _Job:
+        """
+        读取并解码图片；超大图片只读文件头，像素留到置换阶段分带解码
+        解密/换密时先凭文件头中的标签校验密码，密码错误的文件不会解码任何像素
+        """
+        path = job.path
+        if job.data is None and not os.path.exists(path):
+            raise _StageError(f"文件不存在: {path}")
+        if job.op == "encrypt":
+            ext = os.path.splitext(path)[1].lower()
+            if ext not in config.SUPPORTED_FORMATS:
+                raise _StageError(f"不支持的文件类型: {ext}")
+        if self._stamp_sources and job.data is None:
             try:
-                img = Image.open(enc_path)
-            except UnidentifiedImageError:
-                return False, f"无法识别的图片: {enc_path}"
-            # 像素解密
-            arr = pixel_shuffle.decrypt_image(img, password)
-            if arr is None:
-                return False, f"解密失败: 密码错误或文件损坏"
-            name, ext = os.path.splitext(os.path.basename(enc_path))
-            if name.endswith("_enc"):
-                name = name[:-4]
-            os.makedirs(output_dir, exist_ok=True)
-            out_path = os.path.join(output_dir, f"{name}{ext}")
-            # 保存解密图片
-            Image.fromarray(arr).save(out_path, format=img.format or "PNG")
+                job.stamp = source_stamp(path)
+            except OSError as e:
+                logger.warning(f"读取源文件信息失败，不写入增量清单: {path} - {e}")
+        t0 = time.perf_counter()
+        if job.op != "encrypt" and container.is_container(path, job.data):
+            self._read_container(job, password)
+            job.metrics.decode_s = time.perf_counter() - t0 - job.metrics.key_check_s
+            return job
+        try:
+            img = Image.open(path if job.data is None else io.BytesIO(job.data))
+        except UnidentifiedImageError:
+            raise _StageError(f"无法识别的图片: {path}")
+        try:
+            job.metrics.bytes_in = os.path.getsize(path) if job.data is None else len(job.data)
+            if job.op != "encrypt":
+                self._verify_key(job, keytag.read_tag(img), password[0] if job.op == "rekey" else password)
+            pixel_shuffle.check_stop(self._should_stop)
+            job.size = img.size
+            job.metrics.pixels = img.width * img.height
+            job.format_params = self._algorithm.save_params(img)
+            decoded = frames.read_frames(img) if frames.frame_count(img) > 1 else None
+            if decoded is not None:
+                job.src, job.frames = decoded
+                job.metrics.pixels *= len(job.src)
+            else:
+                img.seek(0)
+                if tiled.estimate_nbytes(img) <= self.tile_threshold:
+                    job.src = tiled.read_array(img)
+            if job.src is not None:
+                # 像素已复制到数组：只保留模式、调色板与元数据，立即释放 PIL 的解码内存，
+                # 之后同时存在的只有源数组与输出缓冲两份像素
+                tmpl = pixel_shuffle.template(img)
+                img.close()
+                img = tmpl
+        except Exception:
             img.close()
-            return True, f"{enc_path} -> {out_path}"
+            raise
+        job.img = img
+        job.metrics.decode_s = time.perf_counter() - t0 - job.metrics.key_check_s
+        return job
+
+    def _read_container(self, job: _Job, password: _Key):
+        """打开原始像素容器：校验密码后只建立内存映射，像素在置换阶段直接从映射中 gather"""
+        try:
+            src, meta = container.load(job.path if job.data is None else job.data)
+        except (ValueError, KeyError, TypeError) as e:
+            raise _StageError(f"像素容器损坏: {job.path} - {e}")
+        job.metrics.bytes_in = os.path.getsize(job.path) if job.data is None else len(job.data)
+        self._verify_key(job, keytag.parse_tag(meta.get("tag") or ""),
+                         password[0] if job.op == "rekey" else password)
+        if meta.get("algorithm") != self.algorithm:
+            raise _StageError(f"加密算法不一致: {job.path} 使用 {meta.get('algorithm')} 加密")
+        pixel_shuffle.check_stop(self._should_stop)
+        job.container = meta
+        job.img = container.template(meta)
+        job.src = src
+        job.size = container.size(meta)
+        job.metrics.pixels = job.size[0] * job.size[1]
+        if "durations" in meta:
+            job.frames = frames.FrameSet(job.img, meta["durations"], meta["loop"])
+            job.metrics.pixels *= len(src)
+
+    def _verify_key(self, job: _Job, fields: Optional[dict], password: str):
+        """按文件头中的密钥校验标签检查密码与算法；没有标签（旧文件、BMP等）时照常处理"""
+        if fields is None:
+            job.metrics.key_check = "absent"
+            return
+        t0 = time.perf_counter()
+        valid = keytag.verify(fields, password)
+        job.metrics.key_check_s += time.perf_counter() - t0
+        if not valid:
+            job.metrics.key_check = "mismatch"
+            raise _StageError(f"密码错误: {job.path}")
+        job.metrics.key_check = "ok"
+        if fields["alg"] != self.algorithm:
+            raise _StageError(f"加密算法不一致: {job.path} 使用 {fields['alg']} 加密")
+
+    def _permutations(self, op: str, password: _Key, height: int, width: int,
+                      stats: dict) -> tuple[np.ndarray, np.ndarray]:
+        """
+        返回该操作的 (行置换, 列置换)
+        换密时将旧密码的逆置换与新密码的正向置换复合为一次 gather：
+        new[i, j] = plain[r2[i], c2[j]] = enc[inv_r1[r2[i]], inv_c1[c2[j]]]
+        """
+        if op == "rekey":
+            old_password, new_password = password
+            inv_rows, inv_cols = self._algorithm.permutations(old_password, height, width, True, stats)
+            rows, cols = self._algorithm.permutations(new_password, height, width, False, stats)
+            return inv_rows[rows], inv_cols[cols]
+        return self._algorithm.permutations(password, height, width, op == "decrypt", stats)
+
+    def _permute_stage(self, job: _Job, password: _Key) -> _Job:
+        """像素置换到复用的输出缓冲区；超大图片分带解码、置换并组装为输出图片"""
+        img, src = job.img, job.src
+        buf = None
+        try:
+            t0 = time.perf_counter()
+            stats = {}
+            width, height = job.size
+            rows, cols = self._permutations(job.op, password, height, width, stats)
+            t1 = time.perf_counter()
+            job.metrics.permutation_s = t1 - t0
+            if job.op != "decrypt":
+                # 标签的 PBKDF2 派生单独计时，不混入置换生成
+                job.tag = keytag.make_tag(password[1] if job.op == "rekey" else password, self.algorithm)
+                job.metrics.key_check_s += time.perf_counter() - t1
+                t1 = time.perf_counter()
+            job.metrics.cache_hits = stats.get('hits', 0)
+            job.metrics.cache_misses = stats.get('misses', 0)
+            if src is None:
+                # 未压缩的 TIFF/BMP 直接在文件字节上分带置换；存为像素容器时仍需整幅像素
+                layout = None if self._container_output(job) else tiled.raw_layout(img)
+                if layout is not None:
+                    job.result = tiled.permute_file(img, layout, rows, cols, self.tile_budget,
+                                                    threads=self.gather_threads, should_stop=self._should_stop)
+                else:
+                    job.result = tiled.permute_image(img, rows, cols, self.tile_budget,
+                                                      threads=self.gather_threads, should_stop=self._should_stop)
+            elif job.frames is not None:
+                buf = self._buffers.acquire(src.shape, src.dtype)
+                job.result = pixel_shuffle.permute_frames(src, rows, cols, out=buf, threads=self.gather_threads,
+                                                          should_stop=self._should_stop)
+            else:
+                buf = self._buffers.acquire(src.shape, src.dtype)
+                job.result = pixel_shuffle.permute_array(src, rows, cols, out=buf, threads=self.gather_threads,
+                                                         should_stop=self._should_stop)
+            job.src = None
+            job.metrics.gather_s = time.perf_counter() - t1
+            return job
         except Exception as e:
-            logger.error(f"解密失败: {e}")
-            return False, f"解密失败: {enc_path} - {e}"
+            if buf is not None:
+                self._buffers.release(buf)
+            img.close()
+            if isinstance(e, pixel_shuffle.Cancelled):
+                raise
+            if job.op == "encrypt":
+                raise _StageError(f"像素重排加密失败: {job.path}")
+            if job.op == "rekey":
+                raise _StageError(f"更换密码失败: {job.path}")
+            raise _StageError("解密失败: 密码错误或文件损坏")
+
+    def _write_stage(self, job: _Job, output: "str | archive.ArchiveWriter | _MemoryOutput") -> str:
+        """
+        按原格式编码保存结果，释放缓冲区，返回输出路径（写入压缩包时为成员名）
+        先写入同目录下的临时文件再原子替换，失败或取消时不会留下写了一半的输出文件
+        """
+        img = job.img
+        try:
+            pixel_shuffle.check_stop(self._should_stop)
+            t0 = time.perf_counter()
+            name, src_ext = os.path.splitext(os.path.basename(job.path))
+            ext = src_ext.lower() if job.op == "encrypt" else src_ext
+            if self._container_output(job):
+                # 加密结果按设置存为像素容器；容器换密后仍为容器
+                fmt, ext = container.FORMAT, config.CONTAINER_EXTENSION
+            else:
+                fmt = encoders.output_format(img.format or "PNG", self._lossless(job))
+                if job.container is not None:
+                    # 从容器解密时还原原图的扩展名（有损格式改存为无损格式时除外）
+                    ext = job.container["ext"] if fmt == img.format else encoders.extension(fmt)
+                elif fmt != img.format:
+                    ext = encoders.extension(fmt)
+            name = self._output_name(job, name, src_ext, ext)
+            if not isinstance(output, str):
+                # 压缩包成员保留原有的目录层级，编码到内存后直接写入，不产生临时文件
+                member = f"{name}{ext}"
+                if job.data is not None:
+                    member = posixpath.join(posixpath.dirname(job.path), member)
+                buf = io.BytesIO()
+                self._encode(job, buf, fmt)
+                out_path = output.add(member, buf.getvalue())
+                job.metrics.bytes_out = buf.tell()
+            else:
+                output = os.path.join(output, job.subdir)
+                os.makedirs(output, exist_ok=True)
+                out_path = os.path.join(output, f"{name}{ext}")
+                # 隐藏的临时文件名带随机后缀，同名输出并发写入时互不干扰
+                tmp_path = os.path.join(output, f".{name}{ext}.{os.urandom(4).hex()}.part")
+                try:
+                    self._encode(job, tmp_path, fmt)
+                    job.metrics.bytes_out = os.path.getsize(tmp_path)
+                    os.replace(tmp_path, out_path)
+                except BaseException:
+                    try:
+                        os.remove(tmp_path)
+                    except OSError:
+                        pass
+                    raise
+            job.out_path = out_path
+            job.metrics.encode_s = time.perf_counter() - t0
+            return out_path
+        finally:
+            self._release_result(job)
+            img.close()
+
+    @staticmethod
+    def _output_name(job: _Job, name: str, src_ext: str, ext: str) -> str:
+        """
+        输出文件名（不含扩展名）：加密追加 _enc，解密去掉 _enc，换密保持原名。
+        输出扩展名因存为无损格式或像素容器而与输入不同时在名字中保留输入的扩展名，
+        如 x.jpg → x.jpg_enc.png、x.jpg_enc.icr，避免同一批次中的 x.png 与 x.jpg 写到同一个输出；
+        解密时名字中保留的扩展名与输出扩展名相同则去掉，还原为原文件名
+        """
+        keep = src_ext.lower() != ext.lower() and job.container is None
+        if job.op == "encrypt":
+            return f"{name}{src_ext.lower() if keep else ''}_enc"
+        if job.op == "decrypt":
+            if name.endswith("_enc"):
+                name = name[:-4]
+            stem, inner = os.path.splitext(name)
+            if inner.lower() == ext.lower():
+                return stem
+            if inner.lower() in config.SUPPORTED_FORMATS:
+                return name
+            return name + src_ext if keep else name
+        # 换密：与加密的命名一致，保留的扩展名放在 _enc 之前
+        if keep:
+            return f"{name[:-4]}{src_ext}_enc" if name.endswith("_enc") else name + src_ext
+        return name
+
+    def _lossless(self, job: _Job) -> bool:
+        """
+        是否按无损输出：按设置，或从像素容器解密。
+        容器中保存的是未经二次压缩的像素，解密时 JPEG 改存为 PNG、WebP 用无损模式，结果与加密前解码的像素逐一相同
+        """
+        return self.lossless or (job.op == "decrypt" and job.container is not None)
+
+    def _container_output(self, job: _Job) -> bool:
+        """加密/换密结果是否存为像素容器：按设置，或输入本身为容器"""
+        return job.op != "decrypt" and (self.container or job.container is not None)
+
+    def _release_result(self, job: _Job):
+        """归还输出缓冲区；流式结果文件未被移走（失败或取消）时删除"""
+        arr = job.result
+        if isinstance(arr, np.ndarray):
+            self._buffers.release(arr)
+        elif isinstance(arr, str) and os.path.exists(arr):
+            os.remove(arr)
+
+    def _encode(self, job: _Job, fp, fmt: str):
+        """将置换结果按输出格式与编码配置编码到文件路径或文件对象"""
+        img, arr = job.img, job.result
+        if fmt == container.FORMAT:
+            self._write_container(job, fp)
+            return
+        if isinstance(arr, str):
+            # 流式分带的结果已是完整的输出文件（保持输入的未压缩布局），只需更新 TIFF 中的密钥校验标签
+            if fmt == "TIFF":
+                tiled.set_tiff_description(arr, job.tag)
+            tiled.move_file(arr, fp)
+            return
+        params = encoders.save_params(fmt, self.encoder_profile, self._lossless(job))
+        if fmt == img.format:
+            # 算法附加参数（如分块模式沿用的 JPEG 量化表）只适用于原格式
+            params.update(job.format_params)
+        if job.tag is not None:
+            params.update(keytag.save_params(fmt, job.tag))
+        if job.frames is not None:
+            frames.save_frames(frames.to_images(arr, job.frames), fp, fmt, job.frames, **params)
+        else:
+            out_img = arr if isinstance(arr, Image.Image) else pixel_shuffle.to_image(arr, img)
+            out_img.save(fp, format=fmt, **params)
+
+    def _write_container(self, job: _Job, fp):
+        """将置换结果连同模式、原格式、算法与密钥校验标签写为原始像素容器"""
+        img, arr = job.img, job.result
+        if job.container is not None:
+            fmt, ext = job.container["format"], job.container["ext"]
+        else:
+            fmt, ext = img.format or "PNG", os.path.splitext(job.path)[1].lower()
+        # 分带处理的结果与多帧模板带有调色板与透明色；原图此时可能已关闭
+        if isinstance(arr, Image.Image):
+            like = arr
+        else:
+            like = job.frames.template if job.frames is not None else img
+        durations = job.frames.durations if job.frames is not None else None
+        loop = job.frames.loop if job.frames is not None else None
+        meta = container.describe(like, fmt, ext, self.algorithm, job.tag, durations, loop)
+        container.write(fp, np.asarray(arr), meta)
+
+    def _discard(self, job: Optional[_Job]):
+        """流水线取消时清理在途的中间结果"""
+        if job is None or job.img is None:
+            return
+        self._release_result(job)
+        job.img.close()
 
-    def batch_encrypt(self, image_paths: list[str], output_dir: str, password: str) -> tuple[bool, str, list[str]]:
+    def batch_encrypt(self, image_paths: list[str], output_dir: str, password: str,
+                      workers: int = 1, pipeline: bool = False, incremental: bool = False,
+                      subdirs: Optional[dict[str, str]] = None) -> tuple[bool, str, list[str]]:
         """
         批量加密图片
         参数:
             image_paths: 图片路径列表
             output_dir: 输出目录
             password: 加密密码
+            workers: 并行进程数，1为单进程顺序处理，<=0 表示使用全部CPU核心
+            pipeline: 使用 解码→置换→编码 流水线，此时 workers 为解码/编码阶段各自的线程数
+            incremental: 增量模式，跳过输出目录清单中记录的、内容、密码与输出选项均未变化的文件
+            subdirs: 源路径 → 输出目录下的相对子目录；未列出的文件直接输出到 output_dir。
+                同一输出目录中会得到同名输出的文件只处理第一个，其余记为失败，不会互相覆盖
         返回:
             (是否全部成功, 消息, 失败的文件列表)
         """
-        self._stop_requested = False
-        failed = []
-        total = len(image_paths)
-        for i, path in enumerate(image_paths):
-            if self._stop_requested:
-                self._update_status("加密操作已取消", int((i/total)*100))
-                return False, "操作已取消", failed
-            self._update_status(f"加密中: {os.path.basename(path)}", int((i/total)*100))
-            success, _ = self.encrypt_image(path, output_dir, password)
-            if not success:
-                failed.append(path)
-        self._update_status(f"批量加密完成。成功: {total-len(failed)}/{total}", 100)
-        return True, "批量加密完成", failed
+        return self._run_batch("encrypt", image_paths, output_dir, password, workers, pipeline, incremental,
+                               subdirs)
 
-    def batch_decrypt(self, enc_paths: list[str], output_dir: str, password: str) -> tuple[bool, str, list[str]]:
+    def batch_decrypt(self, enc_paths: list[str], output_dir: str, password: str,
+                      workers: int = 1, pipeline: bool = False, incremental: bool = False,
+                      subdirs: Optional[dict[str, str]] = None) -> tuple[bool, str, list[str]]:
         """
         批量解密图片
         参数:
             enc_paths: 加密图片路径列表
             output_dir: 输出目录
             password: 解密密码
+            workers: 并行进程数，1为单进程顺序处理，<=0 表示使用全部CPU核心
+            pipeline: 使用 解码→置换→编码 流水线，此时 workers 为解码/编码阶段各自的线程数
+            incremental / subdirs: 同 batch_encrypt
         返回:
             (是否全部成功, 消息, 失败的文件列表)
         """
+        return self._run_batch("decrypt", enc_paths, output_dir, password, workers, pipeline, incremental,
+                               subdirs)
+
+    def preview_decrypt(self, enc_path: str, password: str,
+                        region: Optional[tuple[int, int, int, int]] = None,
+                        max_size: Optional[int] = None) -> tuple[bool, str, Optional[Image.Image]]:
+        """
+        区域/缩略预览解密：只取输出区域对应的源行与源列，结果留在内存中，不写文件
+        参数:
+            enc_path: 加密图片路径
+            password: 解密密码
+            region: 解密后图片中的区域 (left, top, right, bottom)，默认整幅
+            max_size: 结果最长边上限，超过时按整数步长抽样
+        返回:
+            (是否成功, 消息, 预览图片)
+        """
+        if not os.path.exists(enc_path):
+            return False, f"文件不存在: {enc_path}", None
+        job = _Job("decrypt", enc_path)
+        try:
+            if container.is_container(enc_path):
+                # 像素容器只映射文件，区域预览只读入所需的源行
+                self._read_container(job, password)
+                img = job.img
+            else:
+                img = Image.open(enc_path)
+                job.img = img
+                self._verify_key(job, keytag.read_tag(img), password)
+        except UnidentifiedImageError:
+            return False, f"无法识别的图片: {enc_path}", None
+        except _StageError as e:
+            if job.img is not None:
+                job.img.close()
+            return False, str(e), None
+        try:
+            width, height = img.size if job.container is None else job.size
+            left, top, right, bottom = region or (0, 0, width, height)
+            left, right = max(0, left), min(width, right)
+            top, bottom = max(0, top), min(height, bottom)
+            if left >= right or top >= bottom:
+                return False, f"预览区域无效: {region}", None
+            step = 1
+            if max_size:
+                step = max(1, -(-max(right - left, bottom - top) // max_size))
+            inv_rows, inv_cols = self._algorithm.permutations(password, height, width, inverse=True)
+            # 解密结果 plain[y, x] = enc[inv_rows[y], inv_cols[x]]，区域与抽样直接作用于逆置换
+            rows = inv_rows[top:bottom:step]
+            cols = inv_cols[left:right:step]
+            if job.src is not None:
+                # 多帧容器预览首帧
+                src = job.src[0] if job.frames is not None else job.src
+                preview = pixel_shuffle.to_image(pixel_shuffle.permute_array(src, rows, cols), img)
+            else:
+                preview = pixel_shuffle.to_image(pixel_shuffle.gather_image(img, rows, cols), img)
+            return True, f"预览 {enc_path}: {preview.width}x{preview.height}", preview
+        except Exception as e:
+            logger.error(f"预览失败: {e}")
+            return False, f"预览失败: {enc_path} - {e}", None
+        finally:
+            img.close()
+
+    def rekey_image(self, enc_path: str, output_dir: str, old_password: str,
+                    new_password: str) -> tuple[bool, str]:
+        """
+        更换加密图片的密码：一次解码、一次复合置换、一次编码，不产生中间明文图片
+        参数:
+            enc_path: 加密图片路径
+            output_dir: 输出目录
+            old_password: 原密码
+            new_password: 新密码
+        返回:
+            (是否成功, 消息)
+        """
+        success, msg, job = self._process("rekey", enc_path, output_dir, (old_password, new_password))
+        self.last_metrics = job.metrics
+        return success, msg
+
+    def process_bytes(self, op: str, data: bytes, password: _Key,
+                      name: str = "image.png") -> tuple[bool, str, Optional[bytes], Optional[str]]:
+        """
+        在内存中处理单张图片：输入输出都是文件内容，不读写输出目录
+        像素数据超过 tile_threshold 的图片仍会使用 TEMP_DIR 下的暂存文件，纯内存调用方应调大该阈值
+        参数:
+            op: encrypt / decrypt / rekey
+            data: 图片文件内容
+            password: 密码；rekey 时为 (原密码, 新密码)
+            name: 文件名，用于加密时的类型检查与结果文件名
+        返回:
+            (是否成功, 消息, 结果文件内容, 结果文件名)
+        """
         self._stop_requested = False
+        target = _MemoryOutput()
+        success, msg, job = self._run_job(_Job(op, name, data), target, password)
+        self.last_metrics = job.metrics
+        return success, msg, target.data, target.name
+
+    def batch_rekey(self, enc_paths: list[str], output_dir: str, old_password: str, new_password: str,
+                    workers: int = 1, pipeline: bool = False, incremental: bool = False,
+                    subdirs: Optional[dict[str, str]] = None) -> tuple[bool, str, list[str]]:
+        """
+        批量更换加密图片的密码
+        参数:
+            enc_paths: 加密图片路径列表
+            output_dir: 输出目录
+            old_password: 原密码
+            new_password: 新密码
+            workers / pipeline / incremental / subdirs: 同 batch_encrypt
+        返回:
+            (是否全部成功, 消息, 失败的文件列表)
+        """
+        return self._run_batch("rekey", enc_paths, output_dir, (old_password, new_password),
+                               workers, pipeline, incremental, subdirs)
+
+    def batch_encrypt_archive(self, inputs: list[str], archive_path: str, password: str,
+                              workers: int = 1) -> tuple[bool, str, list[str]]:
+        """
+        批量加密并写入单个压缩包
+        参数:
+            inputs: 图片文件或 zip/tar 压缩包（逐个成员流式读取）
+            archive_path: 输出压缩包路径，按扩展名决定 zip 或 tar(.gz)
+            password: 加密密码
+            workers: 大于1时使用流水线，解码/编码阶段各 workers 个线程
+        返回:
+            (是否全部成功, 消息, 失败的文件或成员列表)
+        """
+        return self._run_archive("encrypt", inputs, archive_path, password, workers)
+
+    def batch_decrypt_archive(self, inputs: list[str], archive_path: str, password: str,
+                              workers: int = 1) -> tuple[bool, str, list[str]]:
+        """批量解密并写入单个压缩包，参数同 batch_encrypt_archive"""
+        return self._run_archive("decrypt", inputs, archive_path, password, workers)
+
+    def batch_rekey_archive(self, inputs: list[str], archive_path: str, old_password: str,
+                            new_password: str, workers: int = 1) -> tuple[bool, str, list[str]]:
+        """批量更换密码并写入单个压缩包，参数同 batch_encrypt_archive"""
+        return self._run_archive("rekey", inputs, archive_path, (old_password, new_password), workers)
+
+    def batch_bytes(self, op: str, data: bytes, name: str, password: _Key,
+                    workers: int = 1) -> tuple[bool, str, list[str], Optional[bytes]]:
+        """
+        在内存中批处理一个 zip/tar 压缩包的内容，结果以同样格式的压缩包内容返回
+        参数:
+            op: encrypt / decrypt / rekey
+            data: 压缩包内容
+            name: 压缩包文件名，按扩展名判断格式
+            password: 密码；rekey 时为 (原密码, 新密码)
+            workers: 同 batch_encrypt_archive
+        返回:
+            (是否全部完成, 消息, 失败的成员列表, 结果压缩包内容；取消或出错时为 None)
+        """
+        try:
+            reader = archive.ArchiveReader(name, io.BytesIO(data))
+        except (OSError, EOFError, zipfile.BadZipFile, tarfile.TarError) as e:
+            return False, f"无法读取压缩包: {name} - {e}", [name], None
+        out = io.BytesIO()
+        ok, msg, failed = self._run_archive(op, [reader], name, password, workers, out)
+        return ok, msg, failed, out.getvalue() if ok else None
+
+    def _run_archive(self, op: str, inputs: list["str | archive.ArchiveReader"], archive_path: str,
+                     password: _Key, workers: int, fileobj=None) -> tuple[bool, str, list[str]]:
+        """
+        压缩包批处理：输入的压缩包按成员顺序流式读取，结果编码到内存后直接追加到输出压缩包，
+        不在磁盘上展开输入，也不为每个结果创建单独的文件。
+        成员在读取时才按文件头估算内存，因此不做大图优先排序，只做内存预算准入。
+        inputs 中可直接给出已打开的 ArchiveReader；fileobj 不为空时输出压缩包写入该文件对象。
+        """
+        self._begin_batch()
+        label = _OP_LABELS[op]
+        failed = []
+        readers = []
+        plain = []
+        for item in inputs:
+            if isinstance(item, archive.ArchiveReader):
+                readers.append(item)
+                continue
+            if not archive.is_archive(item):
+                plain.append(item)
+                continue
+            try:
+                readers.append(archive.ArchiveReader(item))
+            except (OSError, EOFError, zipfile.BadZipFile, tarfile.TarError) as e:
+                failed.append(item)
+                self._report_result(item, False, f"无法读取压缩包: {item} - {e}", None)
+        unreadable = len(failed)
+        names = plain + [name for reader in readers for name in reader.names]
+        self._batch_metrics = BatchMetrics(op, len(names))
+        # 成员的像素数在读取前未知，进度按文件数计
+        self._progress = scheduler.Progress([scheduler.JobEstimate(name) for name in names])
+
+        def jobs():
+            for path in plain:
+                est = scheduler.probe(path, self.tile_threshold, self.tile_budget)
+                yield _Job(op, path, reserved=est.memory)
+            for reader in readers:
+                try:
+                    for name, data in reader:
+                        est = scheduler.probe(name, self.tile_threshold, self.tile_budget, data=data)
+                        yield _Job(op, name, data, reserved=est.memory)
+                except Exception as e:
+                    # 压缩包中途损坏：放弃其余成员，不影响其他输入
+                    logger.error(f"读取压缩包失败: {reader.path} - {e}")
+                    failed.append(reader.path)
+
+        try:
+            with archive.ArchiveWriter(archive_path, fileobj) as writer:
+                if workers <= 0:
+                    workers = os.cpu_count() or 1
+                workers = max(1, min(workers, len(names) or 1))
+                if workers > 1:
+                    run_failed, cancelled = self._run_pipeline(op, jobs(), writer, password, workers)
+                else:
+                    run_failed, cancelled = self._run_serial(op, jobs(), writer, password)
+                failed += run_failed
+                if cancelled:
+                    # 取消时不留下只含部分成员的压缩包
+                    writer.abort()
+        except (OSError, zipfile.BadZipFile, tarfile.TarError) as e:
+            logger.error(f"写入压缩包失败: {e}")
+            return False, f"写入压缩包失败: {archive_path} - {e}", failed
+        finally:
+            for reader in readers:
+                reader.close()
+            self._progress = None
+            self._batch_metrics.finish()
+            self.last_batch_metrics = self._batch_metrics
+            self._batch_metrics = None
+        return self._batch_result(label, len(names) + unreadable, failed, cancelled)
+
+    def _run_batch(self, op: str, paths: list[str], output_dir: str, password: _Key,
+                   workers: int, pipeline: bool = False, incremental: bool = False,
+                   subdirs: Optional[dict[str, str]] = None) -> tuple[bool, str, list[str]]:
+        """批处理公共流程：按参数选择顺序执行、流水线或进程池并行执行"""
+        self._begin_batch()
+        label = _OP_LABELS[op]
+        skipped = 0
+        subdirs = subdirs or {}
+        paths, clashes = self._split_clashes(op, paths, subdirs)
+        if incremental:
+            self._manifest = Manifest(output_dir)
+            key = "\n".join(password) if isinstance(password, tuple) else password
+            self._manifest_key = (op, key_fingerprint(key, self.algorithm), self._output_options(op))
+            paths, skipped = self._skip_unchanged(op, paths)
+            self._stamp_sources = True
+        self._batch_metrics = BatchMetrics(op, len(paths))
+        for path, first in clashes:
+            self._report_result(path, False, f"输出文件名冲突: {path} 与 {first} 会写到同一个输出，已跳过", None)
+        # 只读文件头估算各作业规模，用于内存准入、大图优先排序与剩余时间估计
+        estimates = [scheduler.probe(path, self.tile_threshold, self.tile_budget) for path in paths]
+        self._progress = scheduler.Progress(estimates)
+        try:
+            if workers <= 0:
+                workers = os.cpu_count() or 1
+            workers = max(1, min(workers, len(paths)))
+            if pipeline:
+                jobs = (_Job(op, est.path, reserved=est.memory, subdir=subdirs.get(est.path, ""))
+                        for est in scheduler.largest_first(estimates))
+                failed, cancelled = self._run_pipeline(op, jobs, output_dir, password, workers)
+            elif workers > 1:
+                failed, cancelled = self._run_parallel(op, scheduler.largest_first(estimates),
+                                                       output_dir, password, workers, subdirs)
+            else:
+                failed, cancelled = self._run_serial(op, (_Job(op, path, subdir=subdirs.get(path, ""))
+                                                          for path in paths), output_dir, password)
+        finally:
+            self._progress = None
+            if self._manifest is not None:
+                self._manifest.compact()
+                self._manifest = None
+                self._stamp_sources = False
+            self._batch_metrics.finish()
+            self.last_batch_metrics = self._batch_metrics
+            self._batch_metrics = None
+        failed = [path for path, _ in clashes] + failed
+        return self._batch_result(label, len(paths) + len(clashes), failed, cancelled, skipped)
+
+    @staticmethod
+    def _split_clashes(op: str, paths: list[str], subdirs: dict[str, str]
+                       ) -> tuple[list[str], list[tuple[str, str]]]:
+        """
+        按文件名预判输出冲突：同一输出子目录中去掉 _enc（解密时）后文件名相同（不区分大小写）的文件
+        会写到同一个输出（如不同目录下的 x.png 平铺到同一输出目录，或解密时的 x_enc.png 与 x.png），
+        只保留第一个。返回 (待处理列表, [(冲突的文件, 先出现的文件)])
+        """
+        seen: dict[tuple[str, str], str] = {}
+        todo, clashes = [], []
+        for path in paths:
+            name, ext = os.path.splitext(os.path.basename(path))
+            if op == "decrypt" and name.endswith("_enc"):
+                name = name[:-4]
+            key = (os.path.normcase(subdirs.get(path, "")), (name + ext).lower())
+            if key in seen:
+                clashes.append((path, seen[key]))
+            else:
+                seen[key] = path
+                todo.append(path)
+        return todo, clashes
+
+    def _batch_result(self, label: str, total: int, failed: list[str], cancelled: bool,
+                      skipped: int = 0) -> tuple[bool, str, list[str]]:
+        """批处理结束：上报汇总状态，返回 (是否完成, 消息, 失败的文件列表)"""
+        if cancelled:
+            if self._abort_message:
+                self._update_status(self._abort_message)
+            return False, self._abort_message or "操作已取消", failed
+        summary = f"批量{label}完成。成功: {total-len(failed)}/{total}"
+        if skipped:
+            summary += f"，未变化跳过: {skipped}"
+        self._update_status(summary, 100)
+        return True, f"批量{label}完成", failed
+
+    def _output_options(self, op: str) -> str:
+        """增量清单中记录的输出选项：改变编码配置、无损或像素容器设置后，已处理的文件须重新输出"""
+        options = f"profile={self.encoder_profile};lossless={int(self.lossless)}"
+        if op != "decrypt":
+            options += f";container={int(self.container)}"
+        return options
+
+    def _skip_unchanged(self, op: str, paths: list[str]) -> tuple[list[str], int]:
+        """增量模式：过滤掉清单中已处理且未变化的文件，返回 (待处理列表, 跳过数)"""
+        todo = []
+        for path in paths:
+            rec = self._manifest.is_current(op, path, *self._manifest_key[1:])
+            if rec is None:
+                todo.append(path)
+            else:
+                self._report_result(path, True, f"未变化，已跳过: {path}", rec['output'])
+        return todo, len(paths) - len(todo)
+
+    def _advance(self, label: str, path: str):
+        """记录一个文件结束，按作业规模加权更新进度并附带剩余时间"""
+        self._progress.advance(path)
+        eta = scheduler.format_eta(self._progress.eta())
+        self._update_status(f"已{label}: {os.path.basename(path)}（{eta}）", self._progress.percent())
+
+    def _run_serial(self, op: str, jobs: Iterable[_Job], output: "str | archive.ArchiveWriter",
+                    password: _Key) -> tuple[list[str], bool]:
+        """逐个处理文件，返回 (失败的文件列表, 是否被取消)"""
+        label = _OP_LABELS[op]
         failed = []
-        total = len(enc_paths)
-        for i, path in enumerate(enc_paths):
+        for job in jobs:
+            path = job.path
             if self._stop_requested:
-                self._update_status("解密操作已取消", int((i/total)*100))
-                return False, "操作已取消", failed
-            self._update_status(f"解密中: {os.path.basename(path)}", int((i/total)*100))
-            success, _ = self.decrypt_image(path, output_dir, password)
+                self._update_status(f"{label}操作已取消", self._progress.percent())
+                return failed, True
+            self._update_status(f"{label}中: {os.path.basename(path)}", self._progress.percent())
+            success, msg, job = self._run_job(job, output, password)
+            if job.cancelled:
+                self._update_status(f"{label}操作已取消", self._progress.percent())
+                return failed, True
+            if not success:
+                failed.append(path)
+            self._report_result(path, success, msg, job.out_path, job.metrics, job.stamp)
+            self._advance(label, path)
+        return failed, bool(self._abort_message)
+
+    def _run_pipeline(self, op: str, jobs: Iterable[_Job], output: "str | archive.ArchiveWriter",
+                      password: _Key, workers: int) -> tuple[list[str], bool]:
+        """
+        流水线处理：解码、置换、编码分别由独立线程执行，级间队列有界。
+        PIL 编解码期间释放GIL，相邻文件的I/O与编解码可与置换重叠。
+        新文件进入解码阶段前须在内存预算内占到额度，文件结束或被丢弃时归还。
+        """
+        label = _OP_LABELS[op]
+        failed = []
+        interrupted = []
+        budget = scheduler.MemoryBudget(self.memory_budget)
+
+        def admitted():
+            for job in jobs:
+                if not budget.acquire(job.reserved, self._should_stop):
+                    return
+                yield job
+
+        def on_done(job, out_path, error):
+            budget.release(job.reserved)
+            path = job.path
+            if isinstance(error, pixel_shuffle.Cancelled):
+                # 阶段内响应了取消：中间结果已由该阶段清理，不计为失败
+                interrupted.append(path)
+                self._finish_job(job, False)
+                return
+            if error is not None:
+                failed.append(path)
+                msg = self._failure_message(op, path, error)
+                self._finish_job(job, False)
+                self._report_result(path, False, msg, None, job.metrics)
+            else:
+                self._finish_job(job, True)
+                self._report_result(path, True, f"{path} -> {out_path}", out_path, job.metrics, job.stamp)
+            self._advance(label, path)
+
+        def on_discard(job):
+            budget.release(job.reserved)
+            self._discard(job)
+
+        stages = [
+            (lambda job, _: self._read_stage(job, password), workers),
+            (lambda job, _: self._permute_stage(job, password), 1),
+            (lambda job, _: self._write_stage(job, output), workers),
+        ]
+        cancelled = run_pipeline(admitted(), stages, on_done, self._should_stop, on_discard)
+        # 小批次中所有文件可能在密钥校验中止生效之前就已读完，流水线照常结束；中止仍视为取消，不报告完成
+        cancelled = cancelled or bool(interrupted) or bool(self._abort_message)
+        if cancelled:
+            self._update_status(f"{label}操作已取消", self._progress.percent())
+        return failed, cancelled
+
+    def _run_parallel(self, op: str, estimates: list[scheduler.JobEstimate], output_dir: str,
+                      password: _Key, workers: int,
+                      subdirs: Optional[dict[str, str]] = None) -> tuple[list[str], bool]:
+        """
+        进程池并行处理文件，按完成顺序上报进度，返回 (失败的文件列表, 是否被取消)。
+        同时在途的任务数不超过 workers 的两倍，且预计内存之和不超过 memory_budget；
+        取消时只需丢弃少量未开始的任务。
+        """
+        label = _OP_LABELS[op]
+        failed = []
+        budget = scheduler.MemoryBudget(self.memory_budget)
+        pending = iter(estimates)
+        est = next(pending, None)
+        in_flight = {}
+        # 取消时置位，工作进程在阶段之间与 gather 行带之间检查并中止在途文件
+        self._stop_event = multiprocessing.Event()
+
+        def collect(fut):
+            done_est = in_flight.pop(fut)
+            budget.release(done_est.memory)
+            path = done_est.path
+            try:
+                success, msg, out_path, metrics, interrupted, stamp = fut.result()
+            except Exception as e:
+                success, msg, out_path, interrupted = False, f"{label}失败: {path} - {e}", None, False
+                metrics, stamp = FileMetrics(path=path, op=op), None
+            if interrupted:
+                return
             if not success:
+                logger.error(msg)
                 failed.append(path)
-        self._update_status(f"批量解密完成。成功: {total-len(failed)}/{total}", 100)
-        return True, "批量解密完成", failed
+            self._report_result(path, success, msg, out_path, metrics, stamp)
+            self._advance(label, path)
+
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=_pool_init,
+                                   initargs=(password, self.algorithm, self.encoder_profile, self.lossless,
+                                             self.container, self._stop_event, self._stamp_sources))
+        try:
+            while True:
+                while (not self._stop_requested and est is not None and len(in_flight) < workers * 2
+                       and budget.try_acquire(est.memory)):
+                    out_dir = os.path.join(output_dir, (subdirs or {}).get(est.path, ""))
+                    in_flight[pool.submit(_pool_run, op, est.path, out_dir)] = est
+                    est = next(pending, None)
+                if self._stop_requested:
+                    self._update_status(f"{label}操作已取消", self._progress.percent())
+                    return failed, True
+                if not in_flight:
+                    return failed, bool(self._abort_message)
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for fut in finished:
+                    collect(fut)
+        finally:
+            # 取消后在途文件很快中止并删除临时文件，等待它们退出，返回时输出目录中不留半成品
+            pool.shutdown(wait=True, cancel_futures=True)
+            self._stop_event = None
+            # 等待期间已写完的文件照常上报并记入清单；未开始的任务已被丢弃，不再上报
+            for fut in [fut for fut in in_flight if fut.done() and not fut.cancelled()]:
+                collect(fut)
+
+class _MemoryOutput:
+    """只保存单个结果的内存输出目标，接口与 archive.ArchiveWriter.add 相同"""
+
+    def __init__(self):
+        self.name: Optional[str] = None
+        self.data: Optional[bytes] = None
+
+    def add(self, name: str, data: bytes) -> str:
+        self.name, self.data = name, data
+        return name
+
+class _StageError(Exception):
+    """单文件处理中的预期错误，消息直接返回给调用方"""
+
+# 批处理操作名 -> 状态消息中使用的文字
+_OP_LABELS = {"encrypt": "加密", "decrypt": "解密", "rekey": "换密"}
+
+# 进程池工作进程内的状态：每个进程只初始化一次，之后处理的所有文件共用
+_worker_crypto: Optional[ImageCrypto] = None
+_worker_password: Optional[_Key] = None
+
+def _pool_init(password: _Key, algorithm: str, encoder_profile: str, lossless: bool, container: bool,
+               stop_event, stamp_sources: bool = False):
+    """进程池初始化：创建进程内的 ImageCrypto 并记住密码，置换缓存与缓冲区在进程内跨文件复用"""
+    global _worker_crypto, _worker_password
+    # 终端的 Ctrl+C 会发给整个进程组：工作进程忽略 SIGINT，由主进程通过 stop_event 取消，
+    # 在途文件照常中止并删除临时文件，不会被 KeyboardInterrupt 打断而留下 .part
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _worker_crypto = ImageCrypto(algorithm, encoder_profile, lossless, container)
+    _worker_crypto.gather_threads = 1
+    _worker_crypto._stop_event = stop_event
+    _worker_crypto._stamp_sources = stamp_sources
+    _worker_password = password
+
+def _pool_run(op: str, path: str, output_dir: str
+              ) -> tuple[bool, str, Optional[str], FileMetrics, bool, Optional[dict]]:
+    """在工作进程中处理单个文件，返回 (是否成功, 消息, 输出路径, 指标, 是否被取消, 源文件信息)"""
+    success, msg, job = _worker_crypto._process(op, path, output_dir, _worker_password)
+    return success, msg, job.out_path, job.metrics, job.cancelled, job.stamp
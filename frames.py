@@ -0,0 +1,99 @@
+# frames.py v13
+import logging
+import threading
+from contextlib import contextmanager
+import numpy as np
+from PIL import GifImagePlugin, Image, ImageSequence
+import pixel_shuffle
+
+logger = logging.getLogger("img-crypto")
+
+# read_frames 期间使用的 GIF 载入策略：后续帧仅在局部调色板与首帧不同时才转为 RGB，共用全局调色板的动图整体保持P模式
+_GIF_STRATEGY = GifImagePlugin.LoadingStrategy.RGB_AFTER_DIFFERENT_PALETTE_ONLY
+_strategy_lock = threading.Lock()
+_strategy_users = 0
+_strategy_saved = None
+
+@contextmanager
+def _gif_loading_strategy():
+    """
+    在读取多帧期间设置 GifImagePlugin.LOADING_STRATEGY，最后一个使用者退出时恢复原值。
+    该设置是 Pillow 的模块级全局变量：流水线中多个线程同时读取时按引用计数共用，不会被先退出的线程提前恢复；
+    期间同一进程中其他代码打开的 GIF 也会使用这一策略
+    """
+    global _strategy_users, _strategy_saved
+    with _strategy_lock:
+        if _strategy_users == 0:
+            _strategy_saved = GifImagePlugin.LOADING_STRATEGY
+            GifImagePlugin.LOADING_STRATEGY = _GIF_STRATEGY
+        _strategy_users += 1
+    try:
+        yield
+    finally:
+        with _strategy_lock:
+            _strategy_users -= 1
+            if _strategy_users == 0:
+                GifImagePlugin.LOADING_STRATEGY = _strategy_saved
+
+# 支持帧时长与循环次数的动画格式
+_ANIMATION_FORMATS = {"GIF", "PNG", "WEBP"}
+
+class FrameSet:
+    """多帧图片解码后的公共信息：统一的模式、调色板、透明色与每帧时长"""
+
+    def __init__(self, template: Image.Image, durations: list[int], loop: int | None):
+        # 1x1 模板图片，携带模式、调色板与透明色，供 pixel_shuffle.to_image 还原各帧
+        self.template = template
+        self.durations = durations
+        self.loop = loop
+
+def frame_count(image: Image.Image) -> int:
+    """图片帧数；静态图片为1"""
+    return getattr(image, "n_frames", 1)
+
+def _common_mode(frames: list[Image.Image]) -> str:
+    """各帧模式不一致时（如GIF局部调色板不同的帧被解码为RGB）统一转换的目标模式"""
+    modes = {f.mode for f in frames}
+    if len(modes) == 1:
+        return modes.pop()
+    has_alpha = any(f.mode in ("RGBA", "LA", "PA") or "transparency" in f.info for f in frames)
+    return "RGBA" if has_alpha else "RGB"
+
+def read_frames(image: Image.Image) -> tuple[np.ndarray, FrameSet] | None:
+    """
+    解码全部帧并堆叠为 (帧, 高, 宽[, 通道]) 数组，所有帧共用一组行/列置换
+    参数:
+        image: 已打开的多帧图片（动图或多页TIFF）
+    返回:
+        (像素数组, 帧信息)；各帧尺寸不一致（如页面大小不同的TIFF）时返回 None
+    """
+    frames = []
+    durations = []
+    with _gif_loading_strategy():
+        for frame in ImageSequence.Iterator(image):
+            durations.append(frame.info.get("duration", 0))
+            frames.append(frame.copy())
+    if len({f.size for f in frames}) != 1:
+        logger.warning(f"各帧尺寸不一致，仅处理首帧: {image.filename}")
+        return None
+    mode = _common_mode(frames)
+    first = frames[0] if frames[0].mode == mode else frames[0].convert(mode)
+    arr = np.stack([np.asarray(f if f.mode == mode else f.convert(mode)) for f in frames])
+    template = Image.new(mode, (1, 1))
+    if mode == "P":
+        template.putpalette(first.getpalette())
+        if "transparency" in first.info:
+            template.info["transparency"] = first.info["transparency"]
+    return arr, FrameSet(template, durations, image.info.get("loop"))
+
+def to_images(arr: np.ndarray, frame_set: FrameSet) -> list[Image.Image]:
+    """将 (帧, 高, 宽[, 通道]) 数组还原为各帧图片"""
+    return [pixel_shuffle.to_image(arr[k], frame_set.template) for k in range(len(arr))]
+
+def save_frames(images: list[Image.Image], fp, fmt: str, frame_set: FrameSet, **params):
+    """保存多帧图片，动画格式保留每帧时长与循环次数"""
+    if fmt in _ANIMATION_FORMATS:
+        params["duration"] = frame_set.durations
+        if frame_set.loop is not None:
+            params["loop"] = frame_set.loop
+    images[0].save(fp, format=fmt, save_all=True, append_images=images[1:], **params)
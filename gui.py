@@ -1,13 +1,17 @@
 
 # gui.py_v13
 import os
+import queue
+import tempfile
 import gradio as gr
 import time
-from typing import Optional
+from typing import Callable, Optional
+import archive
 import config
 import utils
 import crypto_core
 import threading
+from result_store import ResultStore
 
 # 新增
 import tkinter as tk
@@ -15,12 +19,10 @@ from tkinter import filedialog
 
 class CryptoGUI:
     def __init__(self):
-        self.crypto = crypto_core.ImageCrypto()
         utils.setup_folders()
-        self.status_message = ""
-        self.progress = 0
-        self.operation_thread: Optional[threading.Thread] = None
-        self.result_files: Optional[list[str]] = None
+        # 未指定输出目录时的结果存放处，后台按配额与存放时长清理
+        self.store = ResultStore()
+        self.store.start()
         self.build_interface()
 
     # 新增本地目录选择弹窗功能
@@ -48,6 +50,8 @@ class CryptoGUI:
         with gr.Blocks(title=config.UI_TITLE, theme=config.UI_THEME) as self.interface:
             gr.Markdown(f"# {config.UI_TITLE}")
             gr.Markdown(config.UI_DESCRIPTION)
+            # 每个浏览器会话独立的状态：操作名 -> 正在运行的 ImageCrypto，供取消按钮使用
+            session = gr.State({})
 
             with gr.Tab("图片加密"):
                 with gr.Row():
@@ -65,10 +69,33 @@ class CryptoGUI:
                         encrypt_files = gr.File(
                             label="选择要加密的图片文件",
                             file_count="multiple",
-                            file_types=config.SUPPORTED_FORMATS,
+                            file_types=config.SUPPORTED_FORMATS + config.ARCHIVE_FORMATS,
                             type="filepath"
                         )
                         gr.Markdown("**密码要求**：8-32位，必须包含大写字母、小写字母和数字")
+                        encrypt_algorithm = gr.Dropdown(
+                            label="加密算法",
+                            choices=list(config.ENCRYPTION_ALGORITHMS),
+                            value=config.DEFAULT_ALGORITHM,
+                            info="BLOCK_SHUFFLE 按16×16块重排，适合JPEG"
+                        )
+                        with gr.Row():
+                            encrypt_profile = gr.Dropdown(
+                                label="输出编码",
+                                choices=list(config.ENCODER_PROFILES),
+                                value=config.DEFAULT_ENCODER_PROFILE,
+                                info="fastest 最快但文件较大，smallest 最小但最慢"
+                            )
+                            encrypt_lossless = gr.Checkbox(
+                                label="强制无损输出",
+                                value=False,
+                                info="JPEG 改存为 PNG，WebP 使用无损模式，解密后与原图一致"
+                            )
+                            encrypt_container = gr.Checkbox(
+                                label="存为像素容器 (.icr)",
+                                value=False,
+                                info="不压缩的原始像素，加解密不经编解码，文件较大"
+                            )
                         with gr.Row():
                             encrypt_output_dir = gr.Textbox(
                                 label="输出目录(可选)",
@@ -76,6 +103,11 @@ class CryptoGUI:
                             )
                             # 新增本地选择目录按钮
                             encrypt_dir_btn = gr.Button("本地选择输出目录", elem_id="btn-local-dir-encrypt")
+                        encrypt_pack = gr.Checkbox(
+                            label="结果打包为单个 zip",
+                            value=False,
+                            info="上传压缩包时自动打包"
+                        )
                         encrypt_btn = gr.Button("开始加密", variant="primary")
                         encrypt_cancel_btn = gr.Button("取消操作")
                     with gr.Column():
@@ -110,9 +142,20 @@ class CryptoGUI:
                         decrypt_files = gr.File(
                             label="选择要解密的文件",
                             file_count="multiple",
-                            file_types=config.ENCRYPTED_EXTENSION,
+                            file_types=config.ENCRYPTED_EXTENSION + config.ARCHIVE_FORMATS,
                             type="filepath"
                         )
+                        decrypt_algorithm = gr.Dropdown(
+                            label="加密算法",
+                            choices=list(config.ENCRYPTION_ALGORITHMS),
+                            value=config.DEFAULT_ALGORITHM,
+                            info="须与加密时一致"
+                        )
+                        decrypt_profile = gr.Dropdown(
+                            label="输出编码",
+                            choices=list(config.ENCODER_PROFILES),
+                            value=config.DEFAULT_ENCODER_PROFILE
+                        )
                         with gr.Row():
                             decrypt_output_dir = gr.Textbox(
                                 label="输出目录(可选)",
@@ -120,7 +163,13 @@ class CryptoGUI:
                             )
                             # 新增本地选择目录按钮
                             decrypt_dir_btn = gr.Button("本地选择输出目录", elem_id="btn-local-dir-decrypt")
+                        decrypt_pack = gr.Checkbox(
+                            label="结果打包为单个 zip",
+                            value=False,
+                            info="上传压缩包时自动打包"
+                        )
                         decrypt_btn = gr.Button("开始解密", variant="primary")
+                        decrypt_preview_btn = gr.Button("快速预览（首个文件，不写入磁盘）")
                         decrypt_cancel_btn = gr.Button("取消操作")
                     with gr.Column():
                         decrypt_info = gr.Textbox(
@@ -138,20 +187,81 @@ class CryptoGUI:
                             type="filepath",
                             visible=False
                         )
+                        decrypt_preview = gr.Image(
+                            label="解密预览",
+                            type="pil",
+                            interactive=False
+                        )
+
+            with gr.Tab("更换密码"):
+                with gr.Row():
+                    with gr.Column():
+                        rekey_old_password = gr.Textbox(
+                            label="原密码",
+                            type="password",
+                            placeholder="加密时使用的密码"
+                        )
+                        rekey_new_password = gr.Textbox(
+                            label="新密码",
+                            type="password",
+                            placeholder="请输入8~32位，包含大小写字母和数字"
+                        )
+                        rekey_files = gr.File(
+                            label="选择要更换密码的加密文件",
+                            file_count="multiple",
+                            file_types=config.ENCRYPTED_EXTENSION + config.ARCHIVE_FORMATS,
+                            type="filepath"
+                        )
+                        rekey_algorithm = gr.Dropdown(
+                            label="加密算法",
+                            choices=list(config.ENCRYPTION_ALGORITHMS),
+                            value=config.DEFAULT_ALGORITHM,
+                            info="须与加密时一致"
+                        )
+                        with gr.Row():
+                            rekey_output_dir = gr.Textbox(
+                                label="输出目录(可选)",
+                                value=""
+                            )
+                            rekey_dir_btn = gr.Button("本地选择输出目录", elem_id="btn-local-dir-rekey")
+                        rekey_btn = gr.Button("开始更换密码", variant="primary")
+                        rekey_cancel_btn = gr.Button("取消操作")
+                    with gr.Column():
+                        rekey_info = gr.Textbox(
+                            label="信息",
+                            interactive=False,
+                            lines=6
+                        )
+                        rekey_progress = gr.Slider(
+                            minimum=0, maximum=100, value=0, step=1, label="进度"
+                        )
+                        rekey_result = gr.File(
+                            label="换密结果",
+                            file_count="multiple",
+                            interactive=False,
+                            type="filepath",
+                            visible=False
+                        )
 
             with gr.Tab("帮助说明"):
                 gr.Markdown("""
 ### 使用说明
 
 **加密：**
-1. 上传图片，输入合法密码（8-32位，含大写、小写、数字）。
+1. 上传图片或包含图片的 zip/tar 压缩包，输入合法密码（8-32位，含大写、小写、数字）。
 2. 可手动填写输出目录，或点击“本地选择输出目录”按钮弹窗选择。
-3. 点击“开始加密”，完成后可下载加密文件。
+3. 点击“开始加密”，完成后可下载加密文件；勾选“结果打包为单个 zip”或上传压缩包时只生成一个压缩包。
 
 **解密：**
 1. 上传加密后文件，输入密码。
 2. 可手动填写输出目录，或点击“本地选择输出目录”按钮弹窗选择。
 3. 点击“开始解密”，完成后可下载解密图片。
+4. 大图可先点击“快速预览”，只解密缩略图用于核对，不写入磁盘。
+5. 本工具加密的图片（BMP除外）带有密钥校验信息，密码错误时会立即提示，不会生成乱码图片。
+
+**更换密码：**
+1. 上传加密文件，输入原密码和新密码。
+2. 点击“开始更换密码”，每个文件只解码、重排、编码一次，过程中不会生成解密后的图片。
                 """)
 
             # 本地选择目录按钮绑定
@@ -163,6 +273,10 @@ class CryptoGUI:
                 fn=lambda: self.select_local_directory(),
                 outputs=[decrypt_output_dir]
             )
+            rekey_dir_btn.click(
+                fn=lambda: self.select_local_directory(),
+                outputs=[rekey_output_dir]
+            )
 
             # 密码显示/隐藏与生成
             generate_btn.click(
@@ -185,107 +299,263 @@ class CryptoGUI:
             # ========== 加密/解密按钮 ===========
             encrypt_btn.click(
                 fn=self.start_encrypt,
-                inputs=[encrypt_files, encrypt_password, encrypt_output_dir],
+                inputs=[encrypt_files, encrypt_password, encrypt_output_dir, encrypt_algorithm, encrypt_pack,
+                        encrypt_profile, encrypt_lossless, encrypt_container, session],
                 outputs=[encrypt_info, encrypt_progress, encrypt_result]
             )
             encrypt_cancel_btn.click(
-                fn=self.cancel_operation,
-                outputs=[encrypt_info]
+                fn=lambda state: self.cancel_operation(state, "encrypt"),
+                inputs=[session],
+                outputs=[encrypt_info],
+                queue=False
             )
             decrypt_btn.click(
                 fn=self.start_decrypt,
-                inputs=[decrypt_files, decrypt_password, decrypt_output_dir],
+                inputs=[decrypt_files, decrypt_password, decrypt_output_dir, decrypt_algorithm, decrypt_pack,
+                        decrypt_profile, session],
                 outputs=[decrypt_info, decrypt_progress, decrypt_result]
             )
             decrypt_cancel_btn.click(
-                fn=self.cancel_operation,
-                outputs=[decrypt_info]
+                fn=lambda state: self.cancel_operation(state, "decrypt"),
+                inputs=[session],
+                outputs=[decrypt_info],
+                queue=False
+            )
+            decrypt_preview_btn.click(
+                fn=self.preview_decrypt,
+                inputs=[decrypt_files, decrypt_password, decrypt_algorithm],
+                outputs=[decrypt_info, decrypt_preview]
+            )
+            rekey_btn.click(
+                fn=self.start_rekey,
+                inputs=[rekey_files, rekey_old_password, rekey_new_password, rekey_output_dir, rekey_algorithm,
+                        session],
+                outputs=[rekey_info, rekey_progress, rekey_result]
+            )
+            rekey_cancel_btn.click(
+                fn=lambda state: self.cancel_operation(state, "rekey"),
+                inputs=[session],
+                outputs=[rekey_info],
+                queue=False
             )
-
-            self.crypto.set_status_callback(self.update_status)
 
     def launch(self, share=False):
+        # 生成器处理函数依赖队列逐步推送进度；同时运行的批处理数受限，避免多用户并发耗尽内存
+        self.interface.queue(default_concurrency_limit=config.UI_CONCURRENCY_LIMIT)
         self.interface.launch(share=share)
 
-    def start_encrypt(self, files, password, output_dir):
-        if not files:
-            return "请选择要加密的图片", 0, None
-        is_valid, msg = utils.validate_password(password)
-        if not is_valid:
-            return msg, 0, None
+    def _prepare_output_dir(self, output_dir: str, prefix: str) -> tuple[bool, str]:
+        """未指定时在结果存储中新建唯一的作业目录，返回 (是否可用, 目录或错误消息)"""
         if not output_dir:
-            output_dir = os.path.join(config.TEMP_DIR, f"enc_{int(time.time())}")
+            try:
+                return True, self.store.create(prefix)
+            except OSError as e:
+                return False, f"创建输出目录失败: {e}"
         if not os.path.exists(output_dir):
             try:
                 os.makedirs(output_dir)
             except Exception as e:
-                return f"创建输出目录失败: {e}", 0, None
+                return False, f"创建输出目录失败: {e}"
         if not os.access(output_dir, os.W_OK):
-            return f"输出目录无写权限: {output_dir}", 0, None
+            return False, f"输出目录无写权限: {output_dir}"
+        return True, output_dir
 
-        def encrypt_thread():
-            self.crypto.batch_encrypt(files, output_dir, password)
+    @staticmethod
+    def _archive_path(output_dir: str, prefix: str) -> str:
+        """
+        在输出目录中占用一个唯一的压缩包文件名（同一秒内多次运行也不冲突）；
+        批处理完成时由压缩包写入原子替换，未生成压缩包时由 _stream 删除这个空的占位文件
+        """
+        fd, path = tempfile.mkstemp(prefix=f"{prefix}_{time.strftime('%Y%m%d_%H%M%S')}_", suffix=".zip",
+                                    dir=output_dir)
+        os.close(fd)
+        return path
+
+    @staticmethod
+    def _render(status: str, summary: Optional[dict], errors: list[str], progress: int,
+                outputs: Optional[list[str]]):
+        """组装推送给界面的 (信息, 进度, 结果文件)；outputs 为 None 时结果文件框保持不变"""
+        lines = [status]
+        if summary is not None:
+            lines.append(f"已完成 {summary['done']}/{summary['total']}（成功 {summary['succeeded']}，"
+                         f"失败 {summary['failed']}），{summary['files_per_s']:.2f} 文件/秒，"
+                         f"{summary['mp_per_s']:.1f} MP/秒")
+        lines += errors[-config.UI_ERROR_LINES:]
+        if outputs is None:
+            return "\n".join(lines), progress, gr.update()
+        return "\n".join(lines), progress, gr.update(value=list(outputs) or None, visible=bool(outputs))
+
+    def _stream(self, session: Optional[dict], op: str, label: str, crypto: crypto_core.ImageCrypto,
+                run: Callable[[crypto_core.ImageCrypto], tuple[bool, str, list[str]]],
+                output_dir: str, archive_path: Optional[str] = None):
+        """
+        在后台线程执行批处理，按状态/结果/指标回调流式推送进度、吞吐量和每个完成的输出文件
+        结果文件取自批处理上报的输出路径（写入压缩包时为批处理返回后的压缩包），不扫描输出目录；
+        处理中只在有新文件时推送最近的 config.UI_RECENT_OUTPUTS 个，结束时推送全部，避免每次刷新重发整个列表；
+        输出目录为结果存储的作业目录时逐个累计输出大小，结束后交给存储按配额淘汰；
+        浏览器断开（生成器被关闭）时取消批处理
+        """
+        managed = self.store.owns(output_dir)
+        session = {} if session is None else session
+        events: queue.Queue = queue.Queue()
+        crypto.set_status_callback(lambda msg, progress: events.put(("status", msg, progress)))
+        crypto.set_metrics_callback(lambda m, batch: events.put(("metrics", batch.summary())))
+        crypto.set_result_callback(lambda path, ok, msg, out_path: events.put(("result", ok, msg, out_path)))
+
+        def worker():
             try:
-                result_files = []
-                for f in os.listdir(output_dir):
-                    fpath = os.path.join(output_dir, f)
-                    if os.path.isfile(fpath) and f.endswith("_enc"+os.path.splitext(f)[1]):
-                        result_files.append(fpath)
-                self.status_message = f"加密完成：{len(result_files)}个文件"
-                self.result_files = result_files if result_files else None
+                events.put(("done", run(crypto)))
             except Exception as e:
-                self.status_message = f"结果文件获取失败: {e}"
-                self.result_files = None
+                events.put(("done", (False, f"{label}失败: {e}", [])))
+
+        status, progress, summary = f"正在{label}，请稍候...", 0, None
+        outputs, errors = [], []
+        # 上次推送时的结果文件数
+        published = 0
+        session[op] = crypto
+        threading.Thread(target=worker, daemon=True).start()
+        result = None
+        try:
+            yield self._render(status, summary, errors, progress, outputs)
+            while result is None:
+                # 合并一个刷新周期内的全部事件后推送一次，期间没有新事件则不推送
+                deadline = time.monotonic() + config.UI_REFRESH_INTERVAL
+                changed = False
+                while result is None:
+                    try:
+                        event = events.get(timeout=max(0.0, deadline - time.monotonic()))
+                    except queue.Empty:
+                        break
+                    changed = True
+                    kind = event[0]
+                    if kind == "status":
+                        status = event[1]
+                        if event[2] >= 0:
+                            progress = event[2]
+                    elif kind == "metrics":
+                        summary = event[1]
+                    elif kind == "result":
+                        _, ok, msg, out_path = event
+                        if not ok:
+                            errors.append(msg)
+                        elif archive_path is None and out_path:
+                            outputs.append(out_path)
+                            if managed:
+                                self.store.add_file(output_dir, out_path)
+                    else:
+                        result = event[1]
+                if result is None and changed:
+                    recent = None
+                    if len(outputs) != published:
+                        recent, published = outputs[-config.UI_RECENT_OUTPUTS:], len(outputs)
+                    yield self._render(status, summary, errors, progress, recent)
+        finally:
+            if result is None:
+                crypto.stop_operations()
+            if session.get(op) is crypto:
+                del session[op]
+            if archive_path is not None and os.path.exists(archive_path) and not os.path.getsize(archive_path):
+                os.remove(archive_path)
+            if managed:
+                if result is not None and archive_path is not None:
+                    self.store.add_file(output_dir, archive_path)
+                self.store.finish(output_dir)
+        ok, msg, failed = result
+        if archive_path is not None and ok and os.path.exists(archive_path):
+            outputs = [archive_path]
+        if ok:
+            status = f"{label}完成：{archive_path}" if archive_path else f"{label}完成：{len(outputs)}个文件"
+            if failed:
+                status += f"，失败 {len(failed)} 个"
+            progress = 100
+        else:
+            status = msg
+        yield self._render(status, summary, errors, progress, outputs)
 
-        self.status_message = "正在加密，请稍候..."
-        self.progress = 0
-        self.result_files = None
-        self.operation_thread = threading.Thread(target=encrypt_thread)
-        self.operation_thread.start()
-        return self.status_message, self.progress, None
+    def start_encrypt(self, files, password, output_dir, algorithm=config.DEFAULT_ALGORITHM, pack=False,
+                      profile=config.DEFAULT_ENCODER_PROFILE, lossless=False, container=False, session=None):
+        if not files:
+            yield "请选择要加密的图片", 0, None
+            return
+        is_valid, msg = utils.validate_password(password)
+        if not is_valid:
+            yield msg, 0, None
+            return
+        crypto = crypto_core.ImageCrypto(algorithm, profile, lossless, container)
+        ok, output_dir = self._prepare_output_dir(output_dir, "enc")
+        if not ok:
+            yield output_dir, 0, None
+            return
+        if pack or any(archive.is_archive(f) for f in files):
+            # 压缩包进、压缩包出：结果直接写入单个zip，不在输出目录逐个生成文件
+            zip_path = self._archive_path(output_dir, "encrypted")
+            yield from self._stream(session, "encrypt", "加密", crypto,
+                                    lambda c: c.batch_encrypt_archive(files, zip_path, password), output_dir, zip_path)
+            return
+        yield from self._stream(session, "encrypt", "加密", crypto,
+                                lambda c: c.batch_encrypt(files, output_dir, password), output_dir)
 
-    def start_decrypt(self, files, password, output_dir):
+    def start_decrypt(self, files, password, output_dir, algorithm=config.DEFAULT_ALGORITHM, pack=False,
+                      profile=config.DEFAULT_ENCODER_PROFILE, session=None):
         if not files:
-            return "请选择要解密的文件", 0, None
+            yield "请选择要解密的文件", 0, None
+            return
         if not password:
-            return "请输入解密密码", 0, None
-        if not output_dir:
-            output_dir = os.path.join(config.TEMP_DIR, f"dec_{int(time.time())}")
-        if not os.path.exists(output_dir):
-            try:
-                os.makedirs(output_dir)
-            except Exception as e:
-                return f"创建输出目录失败: {e}", 0, None
-        if not os.access(output_dir, os.W_OK):
-            return f"输出目录无写权限: {output_dir}", 0, None
-
-        def decrypt_thread():
-            self.crypto.batch_decrypt(files, output_dir, password)
-            try:
-                result_files = []
-                for f in os.listdir(output_dir):
-                    fpath = os.path.join(output_dir, f)
-                    if os.path.isfile(fpath) and os.path.splitext(f)[1].lower() in config.SUPPORTED_FORMATS:
-                        result_files.append(fpath)
-                self.status_message = f"解密完成：{len(result_files)}个文件"
-                self.result_files = result_files if result_files else None
-            except Exception as e:
-                self.status_message = f"结果文件获取失败: {e}"
-                self.result_files = None
+            yield "请输入解密密码", 0, None
+            return
+        crypto = crypto_core.ImageCrypto(algorithm, profile)
+        ok, output_dir = self._prepare_output_dir(output_dir, "dec")
+        if not ok:
+            yield output_dir, 0, None
+            return
+        if pack or any(archive.is_archive(f) for f in files):
+            zip_path = self._archive_path(output_dir, "decrypted")
+            yield from self._stream(session, "decrypt", "解密", crypto,
+                                    lambda c: c.batch_decrypt_archive(files, zip_path, password), output_dir, zip_path)
+            return
+        yield from self._stream(session, "decrypt", "解密", crypto,
+                                lambda c: c.batch_decrypt(files, output_dir, password), output_dir)
 
-        self.status_message = "正在解密，请稍候..."
-        self.progress = 0
-        self.result_files = None
-        self.operation_thread = threading.Thread(target=decrypt_thread)
-        self.operation_thread.start()
-        return self.status_message, self.progress, None
+    def preview_decrypt(self, files, password, algorithm=config.DEFAULT_ALGORITHM):
+        if not files:
+            return "请选择要解密的文件", None
+        if not password:
+            return "请输入解密密码", None
+        crypto = crypto_core.ImageCrypto(algorithm)
+        ok, msg, image = crypto.preview_decrypt(files[0], password, max_size=config.PREVIEW_MAX_SIZE)
+        return msg, image
 
-    def cancel_operation(self):
-        self.status_message = "正在取消操作..."
-        self.crypto.stop_operations()
-        return self.status_message
+    def start_rekey(self, files, old_password, new_password, output_dir, algorithm=config.DEFAULT_ALGORITHM,
+                    session=None):
+        if not files:
+            yield "请选择要更换密码的文件", 0, None
+            return
+        if not old_password:
+            yield "请输入原密码", 0, None
+            return
+        is_valid, msg = utils.validate_password(new_password)
+        if not is_valid:
+            yield f"新密码无效：{msg}", 0, None
+            return
+        crypto = crypto_core.ImageCrypto(algorithm)
+        ok, output_dir = self._prepare_output_dir(output_dir, "rekey")
+        if not ok:
+            yield output_dir, 0, None
+            return
+        if any(archive.is_archive(f) for f in files):
+            zip_path = self._archive_path(output_dir, "rekeyed")
+            yield from self._stream(session, "rekey", "更换密码", crypto,
+                                    lambda c: c.batch_rekey_archive(files, zip_path, old_password, new_password),
+                                    output_dir, zip_path)
+            return
+        yield from self._stream(session, "rekey", "更换密码", crypto,
+                                lambda c: c.batch_rekey(files, output_dir, old_password, new_password),
+                                output_dir)
 
-    def update_status(self, message, progress):
-        self.status_message = message
-        if progress >= 0:
-            self.progress = progress
+    def cancel_operation(self, session, op):
+        """取消当前会话中正在运行的该项操作，不影响其他用户"""
+        crypto = (session or {}).get(op)
+        if crypto is None:
+            return "当前没有进行中的操作"
+        crypto.stop_operations()
+        return "正在取消操作..."
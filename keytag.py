@@ -0,0 +1,85 @@
+# keytag.py v13
+import functools
+import hashlib
+import hmac
+import os
+from typing import Optional
+from PIL import Image, PngImagePlugin
+import config
+
+# 标签格式: image-crypto;v=1;alg=<算法>;nonce=<随机数>;tag=<校验值>
+TAG_PREFIX = "image-crypto"
+TAG_VERSION = 1
+_PNG_KEY = "image-crypto"
+_IMAGE_DESCRIPTION = 0x010E  # EXIF/TIFF 标签 270
+# getexif() 不会触发像素解码的格式（PNG 在缺少 eXIf 块时会整幅解码，故只查文本块）
+_EXIF_FORMATS = {"JPEG", "MPO", "WEBP", "TIFF"}
+
+@functools.lru_cache(maxsize=8)
+def _check_key(password: str) -> bytes:
+    """由密码派生校验密钥；PBKDF2 提高根据标签离线猜测密码的成本，同一密码在进程内只派生一次"""
+    return hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), b"image-crypto-keycheck",
+                               config.KEY_CHECK_ITERATIONS)
+
+def _digest(password: str, algorithm: str, nonce: bytes) -> str:
+    msg = f"{TAG_VERSION}:{algorithm}:".encode("utf-8") + nonce
+    return hmac.new(_check_key(password), msg, hashlib.sha256).hexdigest()[:16]
+
+def make_tag(password: str, algorithm: str) -> str:
+    """生成写入加密图片元数据的密钥校验标签；每个文件使用随机 nonce，相同密码的标签互不相同"""
+    nonce = os.urandom(8)
+    return (f"{TAG_PREFIX};v={TAG_VERSION};alg={algorithm};"
+            f"nonce={nonce.hex()};tag={_digest(password, algorithm, nonce)}")
+
+def parse_tag(text: str) -> Optional[dict]:
+    """解析标签文本；不是本工具写入的或版本不支持时返回 None"""
+    if not text.startswith(TAG_PREFIX + ";"):
+        return None
+    fields = dict(part.split("=", 1) for part in text.split(";")[1:] if "=" in part)
+    if fields.get("v") != str(TAG_VERSION) or not {"alg", "nonce", "tag"} <= fields.keys():
+        return None
+    return fields
+
+def read_tag(image: Image.Image) -> Optional[dict]:
+    """
+    从已打开（未解码）图片的文件头元数据中读取标签：
+    PNG 文本块、GIF 注释、JPEG/WebP 的 EXIF 或 TIFF 的 ImageDescription
+    """
+    candidates = [image.info.get(_PNG_KEY), image.info.get("comment")]
+    if image.format in _EXIF_FORMATS:
+        try:
+            candidates.append(image.getexif().get(_IMAGE_DESCRIPTION))
+        except Exception:
+            pass
+    for text in candidates:
+        if isinstance(text, bytes):
+            text = text.decode("utf-8", "replace")
+        if isinstance(text, str):
+            fields = parse_tag(text)
+            if fields is not None:
+                return fields
+    return None
+
+def verify(fields: dict, password: str) -> bool:
+    """校验密码是否与标签匹配"""
+    try:
+        nonce = bytes.fromhex(fields["nonce"])
+    except ValueError:
+        return False
+    return hmac.compare_digest(_digest(password, fields["alg"], nonce), fields["tag"])
+
+def save_params(fmt: str, tag: str) -> dict:
+    """按输出格式返回写入标签的保存参数；BMP 等不支持元数据的格式返回空字典"""
+    if fmt == "PNG":
+        info = PngImagePlugin.PngInfo()
+        info.add_text(_PNG_KEY, tag)
+        return {"pnginfo": info}
+    if fmt == "GIF":
+        return {"comment": tag}
+    if fmt == "TIFF":
+        return {"tiffinfo": {_IMAGE_DESCRIPTION: tag}}
+    if fmt in _EXIF_FORMATS:
+        exif = Image.Exif()
+        exif[_IMAGE_DESCRIPTION] = tag
+        return {"exif": exif.tobytes()}
+    return {}
@@ -1,7 +1,9 @@
 
 #main.py_v13
+import utils
 from gui import CryptoGUI
 
 if __name__ == "__main__":
+    utils.setup_logging()
     app = CryptoGUI()
     app.launch()
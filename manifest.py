@@ -0,0 +1,115 @@
+# manifest.py v13
+import hashlib
+import hmac
+import json
+import os
+import threading
+from typing import Optional
+
+import config
+import keytag
+
+def key_fingerprint(password: str, algorithm: str = config.DEFAULT_ALGORITHM) -> str:
+    """
+    密钥指纹：用于判断输出是否由同一密码与算法生成。
+    由 keytag 的 PBKDF2 校验密钥做 HMAC，清单文件泄露后离线猜测密码的成本与猜测加密图片的密钥校验标签相同
+    """
+    msg = f"manifest:{algorithm}".encode('utf-8')
+    return hmac.new(keytag._check_key(password), msg, hashlib.sha256).hexdigest()[:16]
+
+def file_digest(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """文件内容的 SHA-256"""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def source_stamp(path: str) -> dict:
+    """
+    源文件的大小、修改时间与内容哈希，供 Manifest.record 使用
+    在处理该文件的线程或工作进程中、读取图片之前调用，哈希计算随作业并行，不集中在上报结果的线程中
+    """
+    st = os.stat(path)
+    return {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'sha256': file_digest(path)}
+
+class Manifest:
+    """
+    输出目录中的增量清单（JSON Lines）。
+    每处理完一个文件追加一行记录：源路径、大小、修改时间、内容哈希、密钥指纹、输出选项、输出路径。
+    崩溃或取消后已追加的记录仍然有效，下次运行据此跳过未变化的文件。
+    """
+
+    def __init__(self, output_dir: str):
+        self.path = os.path.join(output_dir, config.MANIFEST_NAME)
+        self._records: dict[tuple[str, str], dict] = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    # 崩溃时可能残留不完整的最后一行
+                    continue
+                self._records[(rec['op'], rec['source'])] = rec
+
+    def is_current(self, op: str, path: str, fingerprint: str, options: str = "") -> Optional[dict]:
+        """
+        判断文件是否已用同一密钥与输出选项处理且未变化
+        options 为输出选项（编码配置、无损、像素容器）的描述，改变后须重新处理；
+        先比较大小和修改时间；只有修改时间变了才计算内容哈希
+        返回:
+            未变化时返回对应记录，否则返回 None
+        """
+        rec = self._records.get((op, os.path.abspath(path)))
+        if (rec is None or rec['key'] != fingerprint or rec.get('options', "") != options
+                or not os.path.exists(rec['output'])):
+            return None
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        if st.st_size != rec['size']:
+            return None
+        if st.st_mtime_ns != rec['mtime_ns']:
+            if file_digest(path) != rec['sha256']:
+                return None
+            # 内容未变（如仅被 touch），更新修改时间，下次无需再算哈希
+            self._append(dict(rec, mtime_ns=st.st_mtime_ns))
+        return rec
+
+    def record(self, op: str, path: str, fingerprint: str, out_path: str, stamp: dict, options: str = ""):
+        """追加一条处理成功的记录；stamp 为处理前由 source_stamp 取得的源文件信息，options 同 is_current"""
+        self._append({
+            'op': op,
+            'source': os.path.abspath(path),
+            'size': stamp['size'],
+            'mtime_ns': stamp['mtime_ns'],
+            'sha256': stamp['sha256'],
+            'key': fingerprint,
+            'options': options,
+            'output': os.path.abspath(out_path),
+        })
+
+    def _append(self, rec: dict):
+        with self._lock:
+            self._records[(rec['op'], rec['source'])] = rec
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(rec, ensure_ascii=False) + '\n')
+
+    def compact(self):
+        """重写清单，只保留每个文件的最新记录"""
+        with self._lock:
+            if not self._records:
+                return
+            tmp = self.path + '.tmp'
+            with open(tmp, 'w', encoding='utf-8') as f:
+                for rec in self._records.values():
+                    f.write(json.dumps(rec, ensure_ascii=False) + '\n')
+            os.replace(tmp, self.path)
@@ -0,0 +1,99 @@
+# metrics.py v13
+import math
+import threading
+import time
+from dataclasses import asdict, dataclass
+
+@dataclass
+class FileMetrics:
+    """单个文件各阶段的耗时与计数"""
+    path: str
+    op: str
+    success: bool = False
+    decode_s: float = 0.0        # 打开并解码
+    permutation_s: float = 0.0   # 获取行/列置换（含缓存查找）
+    key_check_s: float = 0.0     # 密钥校验标签的生成或验证（PBKDF2）
+    cache_hits: int = 0
+    cache_misses: int = 0
+    gather_s: float = 0.0        # 像素置换
+    encode_s: float = 0.0        # 编码并保存
+    total_s: float = 0.0
+    bytes_in: int = 0
+    bytes_out: int = 0
+    pixels: int = 0
+    key_check: str = ""         # 密钥校验：ok / mismatch / absent（无标签），加密时为空
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+# 参与批次累计的阶段耗时字段
+_STAGE_FIELDS = ("decode_s", "key_check_s", "permutation_s", "gather_s", "encode_s")
+
+def _percentile(sorted_values: list[float], q: float) -> float:
+    """最近秩法分位数"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, math.ceil(q / 100 * len(sorted_values)) - 1)
+    return sorted_values[rank]
+
+class BatchMetrics:
+    """批次级汇总：吞吐量 (files/s、MP/s)、延迟分位数与各阶段累计耗时"""
+
+    def __init__(self, op: str, total: int):
+        self.op = op
+        self.total = total
+        self.started = time.perf_counter()
+        self.finished: float | None = None
+        self.succeeded = 0
+        self.failed = 0
+        self.pixels = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.stage_s = {name: 0.0 for name in _STAGE_FIELDS}
+        self._latencies: list[float] = []
+        self._lock = threading.Lock()
+
+    def add(self, m: FileMetrics):
+        """累计一个文件的指标"""
+        with self._lock:
+            if m.success:
+                self.succeeded += 1
+                self.pixels += m.pixels
+            else:
+                self.failed += 1
+            self.bytes_in += m.bytes_in
+            self.bytes_out += m.bytes_out
+            self.cache_hits += m.cache_hits
+            self.cache_misses += m.cache_misses
+            for name in _STAGE_FIELDS:
+                self.stage_s[name] += getattr(m, name)
+            self._latencies.append(m.total_s)
+
+    def finish(self):
+        self.finished = time.perf_counter()
+
+    def summary(self) -> dict:
+        """当前汇总快照，可直接序列化为JSON"""
+        with self._lock:
+            elapsed = (self.finished or time.perf_counter()) - self.started
+            done = self.succeeded + self.failed
+            latencies = sorted(self._latencies)
+            return {
+                "op": self.op,
+                "total": self.total,
+                "done": done,
+                "succeeded": self.succeeded,
+                "failed": self.failed,
+                "elapsed_s": elapsed,
+                "files_per_s": done / elapsed if elapsed > 0 else 0.0,
+                "mp_per_s": self.pixels / 1e6 / elapsed if elapsed > 0 else 0.0,
+                "latency_p50_s": _percentile(latencies, 50),
+                "latency_p95_s": _percentile(latencies, 95),
+                "bytes_in": self.bytes_in,
+                "bytes_out": self.bytes_out,
+                "cache_hits": self.cache_hits,
+                "cache_misses": self.cache_misses,
+                "stage_s": dict(self.stage_s),
+            }
@@ -0,0 +1,107 @@
+# pipeline.py v13
+import queue
+import threading
+from typing import Any, Callable, Iterable, Optional
+
+import config
+
+# 队列结束标记
+_DONE = object()
+
+def run_pipeline(items: Iterable[Any],
+                 stages: list[tuple[Callable[[Any, Any], Any], int]],
+                 on_done: Callable[[Any, Any, Optional[BaseException]], None],
+                 should_stop: Callable[[], bool],
+                 on_discard: Optional[Callable[[Any], None]] = None,
+                 queue_size: int = config.PIPELINE_QUEUE_SIZE) -> bool:
+    """
+    多级流水线：各级由若干线程执行，级间以有界队列连接，内存占用受队列长度限制
+    参数:
+        items: 输入项（如文件路径）
+        stages: [(阶段函数, 线程数), ...]，阶段函数签名为 fn(item, value) -> 新value，
+                第一级收到的 value 为 None
+        on_done: 每项结束时在调用线程中回调 (item, 结果, 异常)，按完成顺序调用
+        should_stop: 返回 True 时不再读取新输入，已在途的项交给 on_discard 清理
+        on_discard: 取消后丢弃中间结果时的清理函数
+        queue_size: 每个级间队列的容量
+    返回:
+        是否被取消
+    """
+    source = iter(items)
+    source_lock = threading.Lock()
+    done_q: queue.Queue = queue.Queue()
+    queues = [queue.Queue(maxsize=queue_size) for _ in stages[1:]]
+    cancelled = threading.Event()
+
+    def next_item():
+        with source_lock:
+            if cancelled.is_set() or should_stop():
+                cancelled.set()
+                return _DONE
+            return next(source, _DONE)
+
+    def worker(index: int, fn: Callable, upstream: Optional[queue.Queue],
+               downstream: Optional[queue.Queue], remaining: list, lock: threading.Lock):
+        while True:
+            if upstream is None:
+                item = next_item()
+                value = None
+                if item is _DONE:
+                    break
+            else:
+                entry = upstream.get()
+                if entry is _DONE:
+                    break
+                item, value = entry
+            if cancelled.is_set() and upstream is not None:
+                if on_discard:
+                    on_discard(value)
+                done_q.put((item, None, None, True))
+                continue
+            try:
+                result = fn(item, value)
+            except BaseException as e:
+                done_q.put((item, None, e, False))
+                continue
+            if downstream is None:
+                done_q.put((item, result, None, False))
+            else:
+                downstream.put((item, result))
+        # 本级最后一个线程退出时，向下游每个线程发送结束标记
+        with lock:
+            remaining[0] -= 1
+            last = remaining[0] == 0
+        if last:
+            if downstream is None:
+                done_q.put(_DONE)
+            else:
+                for _ in range(stages[index + 1][1]):
+                    downstream.put(_DONE)
+
+    threads = []
+    for index, (fn, count) in enumerate(stages):
+        upstream = queues[index - 1] if index > 0 else None
+        downstream = queues[index] if index < len(queues) else None
+        remaining = [count]
+        lock = threading.Lock()
+        for _ in range(count):
+            t = threading.Thread(target=worker, args=(index, fn, upstream, downstream, remaining, lock),
+                                 daemon=True)
+            t.start()
+            threads.append(t)
+
+    while True:
+        try:
+            entry = done_q.get(timeout=0.1)
+        except queue.Empty:
+            if should_stop():
+                cancelled.set()
+            continue
+        if entry is _DONE:
+            break
+        item, result, error, discarded = entry
+        if not discarded:
+            on_done(item, result, error)
+    for t in threads:
+        t.join()
+    return cancelled.is_set()
@@ -1,8 +1,14 @@
 #pixel_shuffle v13
 
 import hashlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from collections import OrderedDict
+from typing import Callable, Optional
 import numpy as np
 from PIL import Image
+import config
 
 def get_sha256(input: str) -> str:
     """计算字符串的SHA-256哈希值"""
@@ -12,47 +18,295 @@ def get_range(input: str, offset: int, range_len=4) -> str:
     offset = offset % len(input)
     return (input*2)[offset:offset+range_len]
 
+def _swap_targets(sha_key: str, arr_len: int) -> np.ndarray:
+    """批量计算 Fisher-Yates 每一步的交换目标，与逐步调用 get_range 的结果一致"""
+    key_len = len(sha_key)
+    doubled = sha_key * 2
+    # 8位窗口只随 offset % key_len 变化，先算出全部窗口值再按步数广播
+    windows = np.array([int(doubled[i:i + 8], 16) for i in range(key_len)], dtype=np.int64)
+    steps = np.arange(arr_len, dtype=np.int64)
+    return windows[steps % key_len] % (arr_len - steps)
+
+def build_permutation(sha_key: str, arr_len: int) -> np.ndarray:
+    """由哈希密钥生成置换下标，等价于对 np.arange(arr_len) 调用 shuffle_arr"""
+    targets = _swap_targets(sha_key, arr_len).tolist()
+    perm = list(range(arr_len))
+    for i, to_index in enumerate(targets):
+        idx = arr_len - i - 1
+        perm[idx], perm[to_index] = perm[to_index], perm[idx]
+    return np.array(perm, dtype=np.intp)
+
+def invert_permutation(perm: np.ndarray) -> np.ndarray:
+    """求逆置换（与 np.argsort(perm) 相同，但为 O(n)）"""
+    inv = np.empty_like(perm)
+    inv[perm] = np.arange(len(perm), dtype=perm.dtype)
+    return inv
+
 def shuffle_arr(arr: np.ndarray, key: str) -> None:
     """原地打乱数组"""
-    sha_key = get_sha256(key)
-    arr_len = len(arr)
-    for i in range(arr_len):
-        idx = arr_len - i - 1
-        to_index = int(get_range(sha_key, i, range_len=8), 16) % (arr_len - i)
-        arr[idx], arr[to_index] = arr[to_index], arr[idx]
+    arr[:] = arr[build_permutation(get_sha256(key), len(arr))]
+
+class PermutationCache:
+    """线程安全的有界LRU置换缓存，键为 (密码摘要, 轴, 长度)，同时保存逆置换"""
+
+    def __init__(self, maxsize: int = config.PERM_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, password: str, axis: str, length: int,
+            stats: dict | None = None) -> tuple[np.ndarray, np.ndarray]:
+        """
+        获取置换及其逆置换
+        参数:
+            password: 密码
+            axis: 'x' 对应宽度方向，'y' 对应高度方向
+            length: 置换长度
+            stats: 可选，按本次是否命中累加其中的 'hits' / 'misses'
+        返回:
+            (置换, 逆置换)，均为只读数组
+        """
+        digest = get_sha256(password)
+        cache_key = (digest, axis, length)
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is not None:
+                self._entries.move_to_end(cache_key)
+                self.hits += 1
+                if stats is not None:
+                    stats['hits'] = stats.get('hits', 0) + 1
+                return entry
+            self.misses += 1
+        if stats is not None:
+            stats['misses'] = stats.get('misses', 0) + 1
+        # x轴以密码哈希为密钥，y轴以哈希的哈希为密钥（与 shuffle_arr(…, get_sha256(password)) 一致）
+        sha_key = digest if axis == 'x' else get_sha256(digest)
+        perm = build_permutation(sha_key, length)
+        inv = invert_permutation(perm)
+        perm.flags.writeable = False
+        inv.flags.writeable = False
+        entry = (perm, inv)
+        with self._lock:
+            self._entries[cache_key] = entry
+            self._entries.move_to_end(cache_key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return entry
+
+    def clear(self):
+        """清空缓存与统计"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+_perm_cache = PermutationCache()
+
+def get_permutation(password: str, axis: str, length: int,
+                    stats: dict | None = None) -> tuple[np.ndarray, np.ndarray]:
+    """从全局缓存获取 (置换, 逆置换)"""
+    return _perm_cache.get(password, axis, length, stats)
+
+def clear_permutation_cache():
+    """清空全局置换缓存"""
+    _perm_cache.clear()
+
+class BufferPool:
+    """按 (形状, dtype) 复用C连续输出缓冲区，供批处理中尺寸相同的图片共用"""
+
+    def __init__(self, max_free: int = config.BUFFER_POOL_SIZE):
+        self.max_free = max_free
+        self._free: list[np.ndarray] = []
+        self._lock = threading.Lock()
+
+    def acquire(self, shape: tuple, dtype) -> np.ndarray:
+        """取出一个匹配的空闲缓冲区，没有则新分配"""
+        dtype = np.dtype(dtype)
+        with self._lock:
+            for i, buf in enumerate(self._free):
+                if buf.shape == shape and buf.dtype == dtype:
+                    return self._free.pop(i)
+        return np.empty(shape, dtype=dtype)
+
+    def release(self, buf: np.ndarray):
+        """归还缓冲区；调用方须保证之后不再使用它"""
+        with self._lock:
+            self._free.append(buf)
+            while len(self._free) > self.max_free:
+                self._free.pop(0)
+
+class Cancelled(Exception):
+    """gather 过程中检测到取消请求"""
 
-def encrypt_image(image: Image.Image, password: str) -> np.ndarray | None:
-    """像素重排加密"""
+def check_stop(should_stop: Optional[Callable[[], bool]]):
+    """should_stop 返回 True 时抛出 Cancelled"""
+    if should_stop is not None and should_stop():
+        raise Cancelled("操作已取消")
+
+def _check_out(arr: np.ndarray, shape: tuple, out: np.ndarray | None) -> np.ndarray:
+    if out is None:
+        return np.empty(shape, dtype=arr.dtype)
+    if out.shape != shape or out.dtype != arr.dtype or not out.flags.c_contiguous:
+        raise ValueError(f"输出缓冲区不匹配: {out.shape}/{out.dtype}, 需要 {shape}/{arr.dtype}")
+    return out
+
+_gather_pool: ThreadPoolExecutor | None = None
+_gather_pool_lock = threading.Lock()
+
+def gather_threads(nbytes: int, threads: int) -> int:
+    """按输出字节数与可用核心数确定单张图片 gather 的行带数；小图不拆分"""
+    if threads <= 0:
+        threads = os.cpu_count() or 1
+    return max(1, min(threads, nbytes // config.PARALLEL_GATHER_MIN_BYTES))
+
+def _run_bands(fn, nrows: int, bands: int):
+    """将 [0, nrows) 等分为 bands 个行带，在共享线程池中并行执行 fn(start, stop)"""
+    if bands <= 1:
+        fn(0, nrows)
+        return
+    global _gather_pool
+    with _gather_pool_lock:
+        if _gather_pool is None:
+            _gather_pool = ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix="gather")
+    bounds = np.linspace(0, nrows, bands + 1).astype(int)
+    futures = [_gather_pool.submit(fn, start, stop) for start, stop in zip(bounds[:-1], bounds[1:])]
+    # 先等全部行带结束再抛出异常，调用方释放输出缓冲区时不会还有线程在写
+    wait(futures)
+    for fut in futures:
+        fut.result()
+
+def permute_array(arr: np.ndarray, rows: np.ndarray, cols: np.ndarray,
+                  out: np.ndarray | None = None, threads: int = 1,
+                  should_stop: Optional[Callable[[], bool]] = None) -> np.ndarray:
+    """
+    单次gather内核：out[i, j] = arr[rows[i], cols[j]]
+    逐行从源数组取列直接写入预分配的C连续缓冲区，不产生整幅中间副本。
+    支持2维 (L/P/1等) 与3维 (H, W, C) 数组。
+    threads 不为1时大图按输出行带分给线程池（np.take 执行期间释放GIL），
+    各行带写入互不重叠的输出行，结果与单线程逐字节一致；<=0 表示使用全部CPU核心。
+    should_stop 每处理约 config.CANCEL_CHECK_BYTES 输出字节调用一次，返回 True 时抛出 Cancelled。
+    """
+    shape = (len(rows), len(cols)) + arr.shape[2:]
+    out = _check_out(arr, shape, out)
+    _run_bands(lambda start, stop: _gather_rows(arr, rows, cols, out, start, stop, should_stop),
+               len(rows), gather_threads(out.nbytes, threads))
+    return out
+
+def permute_frames(arr: np.ndarray, rows: np.ndarray, cols: np.ndarray,
+                   out: np.ndarray | None = None, threads: int = 1,
+                   should_stop: Optional[Callable[[], bool]] = None) -> np.ndarray:
+    """
+    多帧gather内核：out[f, i, j] = arr[f, rows[i], cols[j]]，所有帧共用同一组置换
+    每个输出行一次 take 同时处理全部帧，Python 循环次数与单帧图片相同，不随帧数增长。
+    threads、should_stop 含义同 permute_array。
+    """
+    shape = (arr.shape[0], len(rows), len(cols)) + arr.shape[3:]
+    out = _check_out(arr, shape, out)
+    check = max(1, config.CANCEL_CHECK_BYTES // max(1, out[:, 0].nbytes)) if len(rows) else 1
+
+    def gather(start: int, stop: int):
+        for c0 in range(start, stop, check):
+            check_stop(should_stop)
+            for i in range(c0, min(c0 + check, stop)):
+                np.take(arr[:, rows[i]], cols, axis=1, out=out[:, i])
+
+    _run_bands(gather, len(rows), gather_threads(out.nbytes, threads))
+    return out
+
+def _gather_rows(arr: np.ndarray, rows: np.ndarray, cols: np.ndarray,
+                 out: np.ndarray, start: int, stop: int,
+                 should_stop: Optional[Callable[[], bool]] = None):
+    """对输出的 [start, stop) 行执行gather"""
+    row_bytes = max(1, out[0].nbytes) if len(out) else 1
+    band = max(1, config.GATHER_BAND_BYTES // row_bytes)
+    if band == 1:
+        # 宽图：源行是视图，直接按列取到输出行
+        check = max(1, config.CANCEL_CHECK_BYTES // row_bytes)
+        for c0 in range(start, stop, check):
+            check_stop(should_stop)
+            for i in range(c0, min(c0 + check, stop)):
+                np.take(arr[rows[i]], cols, axis=0, out=out[i])
+        return
+    # 窄图：逐行调用开销占主导，改为小批量行带
+    check = band * max(1, config.CANCEL_CHECK_BYTES // (band * row_bytes))
+    for b0 in range(start, stop, band):
+        if (b0 - start) % check == 0:
+            check_stop(should_stop)
+        b1 = min(b0 + band, stop)
+        np.take(np.take(arr, rows[b0:b1], axis=0), cols, axis=1, out=out[b0:b1])
+
+def gather_image(image: Image.Image, rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+    """
+    直接从图片中取指定的行和列：out[i, j] = image[rows[i], cols[j]]
+    只逐行裁剪需要的源行，不生成整幅像素数组，适合区域/缩略预览
+    """
+    width = image.width
+    out = None
+    for i, r in enumerate(rows):
+        line = np.asarray(image.crop((0, int(r), width, int(r) + 1)))[0]
+        if out is None:
+            out = np.empty((len(rows), len(cols)) + line.shape[1:], dtype=line.dtype)
+        np.take(line, cols, axis=0, out=out[i])
+    if out is None:
+        raise ValueError("区域为空")
+    return out
+
+def template(image: Image.Image) -> Image.Image:
+    """
+    1x1 模板图片：保留模式、调色板、元数据与格式，供 to_image 还原像素；
+    像素已取出为数组后用它代替原图，解码内存可随原图一起释放
+    """
+    tmpl = Image.new(image.mode, (1, 1))
+    if image.mode in ('P', 'PA'):
+        tmpl.putpalette(image.getpalette())
+    tmpl.info = dict(image.info)
+    tmpl.format = image.format
+    return tmpl
+
+def to_image(arr: np.ndarray, like: Image.Image) -> Image.Image:
+    """将像素数组按原图模式还原为图片，保留P模式调色板与透明色"""
+    img = Image.fromarray(arr)
+    if img.mode == like.mode:
+        return img
+    if like.mode == 'P':
+        img.putpalette(like.getpalette())
+        if 'transparency' in like.info:
+            img.info['transparency'] = like.info['transparency']
+        return img
+    # CMYK/YCbCr/PA 等模式 fromarray 无法推断，按原始字节重建
+    return Image.frombuffer(like.mode, img.size, np.ascontiguousarray(arr), 'raw', like.mode, 0, 1)
+
+def image_permutations(password: str, height: int, width: int, inverse: bool = False,
+                       stats: dict | None = None) -> tuple[np.ndarray, np.ndarray]:
+    """返回 (行置换, 列置换)；inverse=True 时返回解密用的逆置换"""
+    x_perm, inv_x = get_permutation(password, 'x', width, stats)
+    y_perm, inv_y = get_permutation(password, 'y', height, stats)
+    if inverse:
+        return inv_y, inv_x
+    return y_perm, x_perm
+
+def encrypt_array(arr: np.ndarray, password: str, out: np.ndarray | None = None) -> np.ndarray:
+    """对像素数组 (H, W[, C]) 做行列置换加密"""
+    rows, cols = image_permutations(password, arr.shape[0], arr.shape[1])
+    return permute_array(arr, rows, cols, out)
+
+def decrypt_array(arr: np.ndarray, password: str, out: np.ndarray | None = None) -> np.ndarray:
+    """对像素数组 (H, W[, C]) 做逆置换解密"""
+    rows, cols = image_permutations(password, arr.shape[0], arr.shape[1], inverse=True)
+    return permute_array(arr, rows, cols, out)
+
+def encrypt_image(image: Image.Image, password: str, out: np.ndarray | None = None) -> np.ndarray | None:
+    """像素重排加密；out 为可复用的输出缓冲区"""
     try:
-        width, height = image.width, image.height
-        x_arr = np.arange(width)
-        y_arr = np.arange(height)
-        shuffle_arr(x_arr, password)
-        shuffle_arr(y_arr, get_sha256(password))
-        arr = np.array(image)
-        arr = arr[y_arr, :, ...]
-        arr = np.transpose(arr, (1, 0, 2))
-        arr = arr[x_arr, :, ...]
-        arr = np.transpose(arr, (1, 0, 2))
-        return arr
+        return encrypt_array(np.asarray(image), password, out)
     except Exception:
         return None
 
-def decrypt_image(image: Image.Image, password: str) -> np.ndarray | None:
-    """像素重排解密"""
+def decrypt_image(image: Image.Image, password: str, out: np.ndarray | None = None) -> np.ndarray | None:
+    """像素重排解密；out 为可复用的输出缓冲区"""
     try:
-        width, height = image.width, image.height
-        x_arr = np.arange(width)
-        y_arr = np.arange(height)
-        shuffle_arr(x_arr, password)
-        shuffle_arr(y_arr, get_sha256(password))
-        arr = np.array(image)
-        arr = np.transpose(arr, (1, 0, 2))
-        inv_x = np.argsort(x_arr)
-        arr = arr[inv_x, :, ...]
-        arr = np.transpose(arr, (1, 0, 2))
-        inv_y = np.argsort(y_arr)
-        arr = arr[inv_y, :, ...]
-        return arr
+        return decrypt_array(np.asarray(image), password, out)
     except Exception:
-        return None
\ No newline at end of file
+        return None
@@ -0,0 +1,165 @@
+# result_store.py v13
+import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import config
+
+logger = logging.getLogger("img-crypto")
+
+# 作业目录名：操作前缀 + 时间戳（旧版本为 enc_<秒>，本模块为 enc_<日期>_<时间>_<随机后缀>）
+_JOB_DIR = re.compile(r"^[a-z]+_\d+")
+
+class _Entry:
+    """单个作业目录的累计大小与完成时间"""
+
+    __slots__ = ("size", "finished_at")
+
+    def __init__(self, size: int = 0, finished_at: float = 0.0):
+        self.size = size
+        self.finished_at = finished_at or time.time()
+
+class ResultStore:
+    """
+    TEMP_DIR 下的结果存储：每次操作一个唯一的作业目录，按总字节配额与存放时长删除已完成的作业。
+    作业大小在每个输出文件写完时累加，已完成作业按完成时间排列，
+    配额与时长检查都从最早完成的一端逐个淘汰（先完成先淘汰；界面的下载由 Gradio 直接提供，
+    存储无法得知结果是否被再次使用），不重新扫描目录；只有启动时扫描一次，接管遗留的作业目录。
+    进行中的作业不会被删除；按配额淘汰时最近完成的一个作业始终保留，保证刚返回给界面的结果可以下载。
+    """
+
+    def __init__(self, root: str = config.TEMP_DIR, quota: int = config.RESULT_QUOTA_BYTES,
+                 max_age: float = config.RESULT_MAX_AGE):
+        self.root = root
+        self.quota = quota
+        self.max_age = max_age
+        # 全部作业（进行中与已完成）的字节数之和
+        self.used = 0
+        self._active: dict[str, _Entry] = {}
+        self._finished: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        os.makedirs(root, exist_ok=True)
+        self._adopt()
+
+    def _adopt(self):
+        """接管上次运行（或旧版本）留下的作业目录，按修改时间视为已完成作业"""
+        found = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if not _JOB_DIR.match(name) or not os.path.isdir(path):
+                continue
+            size = 0
+            for folder, _, files in os.walk(path):
+                for f in files:
+                    try:
+                        size += os.path.getsize(os.path.join(folder, f))
+                    except OSError:
+                        pass
+            found.append((os.path.getmtime(path), path, size))
+        for mtime, path, size in sorted(found):
+            self._finished[path] = _Entry(size, mtime)
+            self.used += size
+        self.cleanup()
+
+    def create(self, prefix: str) -> str:
+        """新建唯一的作业目录并登记为进行中，返回目录路径；同一秒内多次创建也不会冲突"""
+        path = tempfile.mkdtemp(prefix=f"{prefix}_{time.strftime('%Y%m%d_%H%M%S')}_", dir=self.root)
+        with self._lock:
+            self._active[path] = _Entry()
+        return path
+
+    def owns(self, path: Optional[str]) -> bool:
+        """是否为本存储管理的进行中作业目录"""
+        with self._lock:
+            return path in self._active
+
+    def add_file(self, job_dir: str, path: str):
+        """累加作业目录中新写入文件的大小；超出配额时淘汰最早完成的已完成作业"""
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return
+        with self._lock:
+            entry = self._active.get(job_dir)
+            if entry is None:
+                return
+            entry.size += size
+            self.used += size
+            evicted = self._evict_over_quota()
+        self._remove(evicted)
+
+    def finish(self, job_dir: str):
+        """作业结束（成功、失败或取消）：移入已完成队列的最新一端，之后可被淘汰"""
+        with self._lock:
+            entry = self._active.pop(job_dir, None)
+            if entry is None:
+                return
+            entry.finished_at = time.time()
+            self._finished[job_dir] = entry
+            evicted = self._evict_over_quota()
+        self._remove(evicted)
+
+    def cleanup(self) -> int:
+        """删除超过配额或存放时长的已完成作业，返回删除的作业数"""
+        with self._lock:
+            evicted = self._evict_over_quota()
+            if self.max_age > 0:
+                cutoff = time.time() - self.max_age
+                while self._finished:
+                    if next(iter(self._finished.values())).finished_at >= cutoff:
+                        break
+                    evicted.append(self._pop_oldest())
+        self._remove(evicted)
+        return len(evicted)
+
+    def _evict_over_quota(self) -> list[str]:
+        """调用方持有锁"""
+        evicted = []
+        if self.quota > 0:
+            while self.used > self.quota and len(self._finished) > 1:
+                evicted.append(self._pop_oldest())
+        return evicted
+
+    def _pop_oldest(self) -> str:
+        path, entry = self._finished.popitem(last=False)
+        self.used -= entry.size
+        return path
+
+    @staticmethod
+    def _remove(paths: list[str]):
+        """在锁外删除目录，删除大目录时不阻塞其他作业的登记"""
+        for path in paths:
+            shutil.rmtree(path, ignore_errors=True)
+            logger.info(f"已清理结果目录: {path}")
+
+    def start(self, interval: float = config.RESULT_CLEANUP_INTERVAL):
+        """启动后台清理线程，每隔 interval 秒按存放时长清理一次"""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(interval,), name="result-store-cleanup",
+                                        daemon=True)
+        self._thread.start()
+
+    def _run(self, interval: float):
+        while not self._stop.wait(interval):
+            try:
+                self.cleanup()
+            except Exception as e:
+                logger.error(f"清理结果目录失败: {e}")
+
+    def stop(self):
+        """停止后台清理线程"""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
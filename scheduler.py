@@ -0,0 +1,148 @@
+# scheduler.py v13
+import io
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional
+import numpy as np
+from PIL import Image
+import config
+import container
+import frames
+import tiled
+
+@dataclass
+class JobEstimate:
+    """仅由文件头得到的单个作业规模估计"""
+    path: str
+    pixels: int = 0
+    nbytes: int = 0     # 全部帧解码后的像素字节数
+    memory: int = 0     # 预计峰值内存（字节）
+
+def probe(path: str, tile_threshold: int = config.TILED_THRESHOLD_BYTES,
+          tile_budget: int = config.TILE_MEMORY_BUDGET, data: Optional[bytes] = None) -> JobEstimate:
+    """
+    只读文件头（Image.open 不解码像素）估算作业的像素数与峰值内存
+    内存路径下约为解码字节数的 config.JOB_MEMORY_FACTOR 倍（解码时 PIL 内部图像与像素数组并存，置换时源数组与输出缓冲并存）；
+    分带路径约为一幅解码图加上行带预算，未压缩的 TIFF/BMP 只有行带预算。无法识别的文件估计为0，交给处理阶段报错。
+    data 为压缩包成员的内容，此时 path 仅作为名称。
+    """
+    est = JobEstimate(path)
+    if container.is_container(path, data):
+        # 像素容器的输入是只读映射（页缓存可回收），主要占用为输出缓冲与解密时的编码副本
+        try:
+            meta, _ = container.read_header(path if data is None else data)
+            width, height = container.size(meta)
+            est.pixels = width * height * (len(meta["durations"]) if "durations" in meta else 1)
+            est.nbytes = int(np.prod(meta["shape"], dtype=np.int64)) * np.dtype(meta["dtype"]).itemsize
+        except Exception:
+            return est
+        est.memory = est.nbytes * 2
+        return est
+    try:
+        with Image.open(path if data is None else io.BytesIO(data)) as img:
+            count = frames.frame_count(img)
+            nbytes = tiled.estimate_nbytes(img)
+            est.pixels = img.width * img.height * count
+            streamed = count == 1 and nbytes > tile_threshold and tiled.raw_layout(img) is not None
+    except Exception:
+        return est
+    est.nbytes = nbytes * count
+    if streamed:
+        # 未压缩 TIFF/BMP 直接在文件上分带置换，只占用行带缓冲区
+        est.memory = tile_budget
+    elif count == 1 and nbytes > tile_threshold:
+        est.memory = nbytes + tile_budget
+    else:
+        est.memory = est.nbytes * config.JOB_MEMORY_FACTOR
+    return est
+
+def largest_first(estimates: list[JobEstimate]) -> list[JobEstimate]:
+    """按预计内存从大到小排序：大图先开始，批次末尾只剩小图，各工作者更均衡地同时结束"""
+    return sorted(estimates, key=lambda e: e.memory, reverse=True)
+
+class MemoryBudget:
+    """
+    按预计内存准入作业：在途作业的预计内存之和不超过预算。
+    没有在途作业时，超出预算的单个作业也允许独占执行，避免永远无法开始。
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.used = 0
+        self._cond = threading.Condition()
+
+    def try_acquire(self, amount: int) -> bool:
+        """不等待地尝试占用 amount 字节"""
+        with self._cond:
+            if self.used and self.used + amount > self.limit:
+                return False
+            self.used += amount
+            return True
+
+    def acquire(self, amount: int, should_stop: Callable[[], bool], held: int = 0) -> bool:
+        """
+        等待直到可以占用 amount 字节；should_stop 返回 True 时放弃并返回 False
+        held 为调用方已占用、现在追加申请的额度：除它之外没有在途作业时同样允许独占执行
+        """
+        with self._cond:
+            while self.used > held and self.used + amount > self.limit:
+                if should_stop():
+                    return False
+                self._cond.wait(0.1)
+            self.used += amount
+            return True
+
+    def release(self, amount: int):
+        """归还作业结束后释放的内存额度"""
+        with self._cond:
+            self.used = max(0, self.used - amount)
+            self._cond.notify_all()
+
+class Progress:
+    """
+    按作业规模加权的进度与剩余时间估计。
+    每个作业的权重为像素数加上固定的单文件开销，按已完成权重的平均速率外推剩余时间，
+    混合大图与缩略图的批次中比按文件数估计准确得多。
+    """
+
+    def __init__(self, estimates: list[JobEstimate]):
+        self._weights = {e.path: self._weight(e) for e in estimates}
+        self.total = sum(self._weight(e) for e in estimates) or 1
+        self.done = 0
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _weight(est: JobEstimate) -> int:
+        return est.pixels + config.ETA_FILE_OVERHEAD_PIXELS
+
+    def advance(self, path: str):
+        """记录一个作业结束（成功或失败）"""
+        with self._lock:
+            self.done += self._weights.get(path, config.ETA_FILE_OVERHEAD_PIXELS)
+
+    def percent(self) -> int:
+        with self._lock:
+            return min(100, int(self.done / self.total * 100))
+
+    def eta(self) -> Optional[float]:
+        """预计剩余秒数；尚无完成的作业时返回 None"""
+        with self._lock:
+            if not self.done:
+                return None
+            elapsed = time.perf_counter() - self.started
+            return elapsed / self.done * max(0, self.total - self.done)
+
+def format_eta(seconds: Optional[float]) -> str:
+    """剩余时间的简短中文描述"""
+    if seconds is None:
+        return "剩余时间估算中"
+    seconds = int(round(seconds))
+    if seconds < 60:
+        return f"剩余约 {seconds} 秒"
+    minutes, seconds = divmod(seconds, 60)
+    if minutes < 60:
+        return f"剩余约 {minutes} 分 {seconds} 秒"
+    hours, minutes = divmod(minutes, 60)
+    return f"剩余约 {hours} 小时 {minutes} 分"
@@ -0,0 +1,443 @@
+# server.py v13
+"""
+本地 HTTP 批处理服务：常驻进程内保持一组预热的 ImageCrypto 实例，置换缓存与密钥校验派生结果跨请求复用，
+省去每次调用命令行的启动与置换计算开销。请求体即图片（或 zip/tar 压缩包）内容，结果直接作为响应体返回，
+全程在内存中处理，不写入 TEMP_DIR 与任何输出目录。
+
+接口:
+    POST /encrypt | /decrypt | /rekey                      请求体为单张图片，响应体为结果图片
+    POST /batch/encrypt | /batch/decrypt | /batch/rekey    请求体为 zip/tar 压缩包，响应体为同格式的结果压缩包
+    GET  /health                                           实例与内存预算的使用情况（JSON）
+请求头: X-Password（rekey 时为原密码）、X-New-Password（rekey 的新密码），UTF-8 百分号编码
+查询参数: name（文件名，决定类型检查、压缩包格式与结果文件名）、algorithm、profile、lossless=1、
+          container=1（加密/换密结果存为原始像素容器 .icr；.icr 输入按文件头识别）
+响应头: X-Output-Name（结果文件名）；批处理另有 X-Failed（失败成员的JSON列表），均为百分号编码
+失败时返回 JSON {"error": 消息}：400 参数错误（含压缩包成员解压后超过 --max-member / --max-unpacked）、422 处理失败、503 繁忙（带 Retry-After，调用方应退避重试）
+
+同时处理的请求数不超过实例数，在途请求的预计内存之和不超过 --memory-budget；
+准入在读取请求体之前进行，等待空闲实例或内存额度超过 --queue-timeout 秒的请求直接返回 503，不会无限堆积；
+同时保持的连接（处理线程）数不超过 --max-connections，超出的连接立即返回 503。
+
+示例:
+    python server.py --port 8765 --workers 4
+    curl -H "X-Password: Abcdef12" --data-binary @a.png "http://127.0.0.1:8765/encrypt?name=a.png" -o a_enc.png
+"""
+import argparse
+import io
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+import urllib.parse
+from contextlib import contextmanager
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+from PIL import Image
+
+import archive
+import config
+import crypto_core
+import encoders
+import scheduler
+import utils
+
+logger = logging.getLogger("img-crypto")
+
+_OPS = ("encrypt", "decrypt", "rekey")
+_CONTENT_TYPES = {
+    ".png": "image/png", ".jpg": "image/jpeg", ".jpeg": "image/jpeg", ".gif": "image/gif",
+    ".bmp": "image/bmp", ".tiff": "image/tiff", ".webp": "image/webp",
+    ".zip": "application/zip", ".tar": "application/x-tar", ".gz": "application/gzip", ".tgz": "application/gzip",
+}
+
+class Busy(Exception):
+    """等待时限内没有空闲实例或内存额度"""
+
+class _Slot:
+    """已准入的请求：占用的实例、已取得的内存额度与等待期限"""
+
+    def __init__(self, crypto: crypto_core.ImageCrypto, deadline: float):
+        self.crypto = crypto
+        self.memory = 0
+        self.deadline = deadline
+
+class CryptoService:
+    """
+    HTTP 处理线程共用的服务状态：预热的 ImageCrypto 实例池与在途请求的内存预算。
+    每个实例带有自己的输出缓冲池，同尺寸图片的请求复用缓冲区；置换缓存与密钥校验派生结果为进程级缓存，所有实例共用。
+    """
+
+    def __init__(self, workers: int = config.SERVER_WORKERS,
+                 memory_budget: int = config.BATCH_MEMORY_BUDGET,
+                 queue_timeout: float = config.SERVER_QUEUE_TIMEOUT,
+                 max_body: int = config.SERVER_MAX_BODY_BYTES,
+                 max_member: int = config.SERVER_MAX_MEMBER_BYTES,
+                 max_unpacked: int = config.SERVER_MAX_UNPACKED_BYTES):
+        if workers <= 0:
+            workers = os.cpu_count() or 1
+        self.workers = workers
+        self.queue_timeout = queue_timeout
+        self.max_body = max_body
+        self.max_member = max_member
+        self.max_unpacked = max_unpacked
+        self.budget = scheduler.MemoryBudget(memory_budget)
+        self._idle: queue.Queue = queue.Queue()
+        for _ in range(workers):
+            crypto = crypto_core.ImageCrypto()
+            # 全部在内存中处理，不使用 TEMP_DIR 下的分带暂存文件，大图由内存预算限制
+            crypto.tile_threshold = sys.maxsize
+            # 并发请求各占一个实例，单张图片内不再拆分线程
+            crypto.gather_threads = 1
+            self._idle.put(crypto)
+        self.handled = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def admit(self, length: int):
+        """
+        读取请求体之前的准入：在等待时限内取得一个空闲实例与请求体、结果各一份（2 * length 字节）的内存额度，
+        否则抛出 Busy，繁忙时无需读入请求体即可拒绝；读入后按内容估算的处理内存由 process/process_batch 追加申请
+        """
+        deadline = time.monotonic() + self.queue_timeout
+        try:
+            crypto = self._idle.get(timeout=self.queue_timeout)
+        except queue.Empty:
+            self._count(True)
+            raise Busy("没有空闲的处理实例") from None
+        slot = _Slot(crypto, deadline)
+        try:
+            self._reserve(slot, 2 * length)
+            yield slot
+        finally:
+            self.budget.release(slot.memory)
+            self._idle.put(crypto)
+
+    def _reserve(self, slot: _Slot, memory: int):
+        """在准入期限内为请求追加 memory 字节的内存额度，否则抛出 Busy"""
+        if not self.budget.acquire(memory, lambda: time.monotonic() > slot.deadline, slot.memory):
+            self._count(True)
+            raise Busy("内存预算已满")
+        slot.memory += memory
+
+    def _count(self, busy: bool):
+        with self._lock:
+            if busy:
+                self.rejected += 1
+            else:
+                self.handled += 1
+
+    @staticmethod
+    def _configure(crypto: crypto_core.ImageCrypto, options: dict):
+        """按请求参数设置实例的算法与编码配置；参数无效时抛出 ValueError"""
+        crypto.set_algorithm(options.get("algorithm") or config.DEFAULT_ALGORITHM)
+        crypto.set_encoder_profile(options.get("profile") or config.DEFAULT_ENCODER_PROFILE,
+                                   options.get("lossless", False), options.get("container", False))
+
+    def process(self, op: str, data: bytes, name: str, password: "str | tuple[str, str]",
+                options: dict, slot: Optional[_Slot] = None) -> tuple[bool, str, Optional[bytes], Optional[str]]:
+        """
+        处理单张图片，返回 (是否成功, 消息, 结果内容, 结果文件名)
+        slot 为 admit 取得的准入；为 None 时自行准入
+        """
+        if slot is None:
+            with self.admit(len(data)) as slot:
+                return self.process(op, data, name, password, options, slot)
+        # 只读文件头估算解码与置换的内存，请求体与编码结果已在准入时计入
+        self._reserve(slot, scheduler.probe(name, sys.maxsize, 0, data=data).memory)
+        self._configure(slot.crypto, options)
+        result = slot.crypto.process_bytes(op, data, password, name)
+        self._count(False)
+        return result
+
+    def process_batch(self, op: str, data: bytes, name: str, password: "str | tuple[str, str]",
+                      options: dict, slot: Optional[_Slot] = None) -> tuple[bool, str, list[str], Optional[bytes]]:
+        """
+        处理一个压缩包，返回 (是否全部完成, 消息, 失败的成员列表, 结果压缩包内容)；slot 同 process
+        成员解压后的大小超过 max_member 或总和超过 max_unpacked 时抛出 ValueError
+        """
+        if slot is None:
+            with self.admit(len(data)) as slot:
+                return self.process_batch(op, data, name, password, options, slot)
+        self._reserve(slot, self._archive_memory(data, name))
+        self._configure(slot.crypto, options)
+        result = slot.crypto.batch_bytes(op, data, name, password)
+        self._count(False)
+        return result
+
+    def _archive_memory(self, data: bytes, name: str) -> int:
+        """
+        压缩包请求在输入与输出压缩包之外的预计内存：最大成员的处理内存（成员逐个处理）。
+        先按成员头中记录的解压后大小检查上限，再只解压每个成员开头的 config.SERVER_PROBE_BYTES 字节读取图片文件头，
+        不在准入时完整解压任何成员
+        """
+        try:
+            reader = archive.ArchiveReader(name, io.BytesIO(data))
+        except Exception:
+            # 无法读取的压缩包交给处理阶段报错
+            return 0
+        peak = 0
+        with reader:
+            for member, size in zip(reader.names, reader.sizes):
+                if size > self.max_member:
+                    raise ValueError(f"压缩包成员解压后超过上限 {self.max_member} 字节: {member}")
+            if sum(reader.sizes) > self.max_unpacked:
+                raise ValueError(f"压缩包解压后总大小超过上限 {self.max_unpacked} 字节: {name}")
+            for i, (member, size) in enumerate(zip(reader.names, reader.sizes)):
+                try:
+                    head = reader.head(i, config.SERVER_PROBE_BYTES)
+                    est = scheduler.probe(member, sys.maxsize, 0, data=head)
+                    if not est.memory and size > len(head):
+                        # 文件头不在开头部分（如很大的 EXIF、末尾的 TIFF 目录）：读入整个成员，大小已受 max_member 限制
+                        est = scheduler.probe(member, sys.maxsize, 0, data=reader.head(i, size))
+                except Exception:
+                    continue
+                peak = max(peak, est.memory)
+        return peak
+
+    def stats(self) -> dict:
+        """实例与内存预算的使用情况"""
+        with self._lock:
+            handled, rejected = self.handled, self.rejected
+        return {
+            "workers": self.workers,
+            "idle": self._idle.qsize(),
+            "memory_budget": self.budget.limit,
+            "memory_used": self.budget.used,
+            "handled": handled,
+            "rejected": rejected,
+        }
+
+def _default_name(data: bytes) -> str:
+    """未给出文件名时按图片格式生成"""
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            return "image" + encoders.extension(img.format)
+    except Exception:
+        return "image"
+
+def _content_type(name: str) -> str:
+    return _CONTENT_TYPES.get(os.path.splitext(name)[1].lower(), "application/octet-stream")
+
+class _Handler(BaseHTTPRequestHandler):
+    """请求处理：每个连接一个线程，实际处理受 CryptoService 的实例数与内存预算限制"""
+    server_version = "image-crypto"
+    protocol_version = "HTTP/1.1"
+    # 套接字超时：空闲的长连接与发送过慢的客户端不会一直占用处理线程
+    timeout = config.SERVER_IDLE_TIMEOUT
+
+    def log_message(self, format, *args):
+        logger.info("%s - %s", self.address_string(), format % args)
+
+    def _send(self, status: HTTPStatus, body: bytes, content_type: str, headers: Optional[dict] = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status: HTTPStatus, payload: dict, headers: Optional[dict] = None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self._send(status, body, "application/json; charset=utf-8", headers)
+
+    def _header(self, key: str) -> str:
+        return urllib.parse.unquote(self.headers.get(key, ""))
+
+    def do_GET(self):
+        if urllib.parse.urlsplit(self.path).path == "/health":
+            self._send_json(HTTPStatus.OK, self.server.service.stats())
+        else:
+            self._send_json(HTTPStatus.NOT_FOUND, {"error": f"未知的路径: {self.path}"})
+
+    def do_POST(self):
+        service: CryptoService = self.server.service
+        url = urllib.parse.urlsplit(self.path)
+        parts = url.path.strip("/").split("/")
+        batch = len(parts) == 2 and parts[0] == "batch"
+        op = parts[-1]
+        if op not in _OPS or not (len(parts) == 1 or batch):
+            # 未读取的请求体会污染同一连接上的下一个请求，直接关闭连接
+            self.close_connection = True
+            self._send_json(HTTPStatus.NOT_FOUND, {"error": f"未知的路径: {url.path}"})
+            return
+        try:
+            length = int(self.headers["Content-Length"])
+            if length < 0:
+                raise ValueError(length)
+        except (TypeError, ValueError):
+            self.close_connection = True
+            self._send_json(HTTPStatus.LENGTH_REQUIRED, {"error": "缺少 Content-Length"})
+            return
+        if length > service.max_body:
+            self.close_connection = True
+            self._send_json(HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                            {"error": f"请求体超过上限 {service.max_body} 字节"})
+            return
+
+        # 读取请求体之前先检查请求头与参数并准入；提前拒绝时请求体未读，须关闭连接
+        query = dict(urllib.parse.parse_qsl(url.query))
+        try:
+            key = self._password(op)
+        except ValueError as e:
+            self.close_connection = True
+            self._send_json(HTTPStatus.BAD_REQUEST, {"error": str(e)})
+            return
+        name = query.get("name")
+        if batch:
+            name = name or "batch.zip"
+            if not archive.is_archive(name):
+                self.close_connection = True
+                self._send_json(HTTPStatus.BAD_REQUEST,
+                                {"error": f"压缩包须为 {'/'.join(config.ARCHIVE_FORMATS)}: {name}"})
+                return
+        options = {
+            "algorithm": query.get("algorithm"),
+            "profile": query.get("profile"),
+            "lossless": query.get("lossless", "").lower() in ("1", "true", "yes"),
+            "container": query.get("container", "").lower() in ("1", "true", "yes"),
+        }
+
+        body_read = False
+        try:
+            with service.admit(length) as slot:
+                data = self.rfile.read(length)
+                body_read = True
+                if len(data) < length:
+                    # 客户端在发送完请求体之前断开
+                    self.close_connection = True
+                    return
+                if batch:
+                    ok, msg, failed, body = service.process_batch(op, data, name, key, options, slot)
+                    out_name = name
+                else:
+                    name = name or _default_name(data)
+                    ok, msg, body, out_name = service.process(op, data, name, key, options, slot)
+                    failed = [] if ok else [name]
+        except Busy as e:
+            self.close_connection = not body_read
+            self._send_json(HTTPStatus.SERVICE_UNAVAILABLE, {"error": f"服务繁忙: {e}"}, {"Retry-After": "1"})
+            return
+        except ValueError as e:
+            self._send_json(HTTPStatus.BAD_REQUEST, {"error": str(e)})
+            return
+        if not ok or body is None:
+            self._send_json(HTTPStatus.UNPROCESSABLE_ENTITY, {"error": msg, "failed": failed})
+            return
+        headers = {"X-Output-Name": urllib.parse.quote(out_name)}
+        if batch:
+            headers["X-Failed"] = urllib.parse.quote(json.dumps(failed, ensure_ascii=False))
+        self._send(HTTPStatus.OK, body, _content_type(out_name), headers)
+
+    def _password(self, op: str) -> "str | tuple[str, str]":
+        """从请求头取得密码（rekey 为 (原密码, 新密码)）并校验新密码强度；缺失或无效时抛出 ValueError"""
+        password = self._header("X-Password")
+        if not password:
+            raise ValueError("缺少请求头 X-Password")
+        if op == "rekey":
+            new_password = self._header("X-New-Password")
+            if not new_password:
+                raise ValueError("缺少请求头 X-New-Password")
+        if op != "decrypt":
+            is_valid, msg = utils.validate_password(new_password if op == "rekey" else password)
+            if not is_valid:
+                raise ValueError(msg)
+        return (password, new_password) if op == "rekey" else password
+
+class _Server(ThreadingHTTPServer):
+    """
+    每个连接一个处理线程，同时保持的连接数不超过 max_connections：
+    超出的连接不再创建线程，直接返回 503 并关闭；空闲的长连接在 config.SERVER_IDLE_TIMEOUT 秒后关闭以释放线程
+    """
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], max_connections: int):
+        super().__init__(address, _Handler)
+        self._connections = threading.BoundedSemaphore(max_connections)
+
+    def process_request(self, request, client_address):
+        if not self._connections.acquire(blocking=False):
+            self._reject(request)
+            return
+        try:
+            super().process_request(request, client_address)
+        except BaseException:
+            self._connections.release()
+            raise
+
+    def process_request_thread(self, request, client_address):
+        try:
+            super().process_request_thread(request, client_address)
+        finally:
+            self._connections.release()
+
+    def _reject(self, request):
+        """在接收线程中直接回复 503：响应很小，写入套接字缓冲区即返回，不阻塞后续连接的接收"""
+        body = json.dumps({"error": "服务繁忙: 连接数已达上限"}, ensure_ascii=False).encode("utf-8")
+        head = (f"HTTP/1.1 503 Service Unavailable\r\nContent-Type: application/json; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\nRetry-After: 1\r\nConnection: close\r\n\r\n")
+        try:
+            request.sendall(head.encode("ascii") + body)
+        except OSError:
+            pass
+        self.shutdown_request(request)
+        self.service._count(True)
+
+def make_server(host: str = config.SERVER_HOST, port: int = config.SERVER_PORT,
+                service: Optional[CryptoService] = None,
+                max_connections: int = config.SERVER_MAX_CONNECTIONS) -> ThreadingHTTPServer:
+    """创建（未启动的）服务；port 为 0 时由系统分配端口，见 server.server_address"""
+    server = _Server((host, port), max_connections)
+    server.service = service or CryptoService()
+    return server
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="本地 HTTP 加解密服务")
+    parser.add_argument("--host", default=config.SERVER_HOST,
+                        help=f"监听地址（默认 {config.SERVER_HOST}，仅本机可访问）")
+    parser.add_argument("--port", type=int, default=config.SERVER_PORT)
+    parser.add_argument("-w", "--workers", type=int, default=config.SERVER_WORKERS,
+                        help="同时处理的请求数，0 为按CPU核心数")
+    parser.add_argument("--memory-budget", type=int, metavar="MB",
+                        help=f"在途请求的预计内存上限（默认 {config.BATCH_MEMORY_BUDGET // 2**20} MB）")
+    parser.add_argument("--queue-timeout", type=float, default=config.SERVER_QUEUE_TIMEOUT,
+                        help="等待空闲实例或内存额度的最长秒数，超时返回 503")
+    parser.add_argument("--max-body", type=int, metavar="MB", default=config.SERVER_MAX_BODY_BYTES // 2**20,
+                        help="请求体大小上限")
+    parser.add_argument("--max-member", type=int, metavar="MB", default=config.SERVER_MAX_MEMBER_BYTES // 2**20,
+                        help="压缩包单个成员解压后的大小上限")
+    parser.add_argument("--max-unpacked", type=int, metavar="MB",
+                        default=config.SERVER_MAX_UNPACKED_BYTES // 2**20,
+                        help="压缩包全部成员解压后的大小之和上限")
+    parser.add_argument("--max-connections", type=int, default=config.SERVER_MAX_CONNECTIONS,
+                        help="同时保持的连接（处理线程）数上限，超出时返回 503")
+    parser.add_argument("-v", "--verbose", action="store_true", help="输出日志到 logs 目录与标准错误")
+    return parser
+
+def main(argv: list[str] | None = None) -> int:
+    args = build_parser().parse_args(argv)
+    if args.verbose:
+        utils.setup_logging()
+    service = CryptoService(args.workers,
+                            args.memory_budget * 2**20 if args.memory_budget else config.BATCH_MEMORY_BUDGET,
+                            args.queue_timeout, args.max_body * 2**20,
+                            args.max_member * 2**20, args.max_unpacked * 2**20)
+    server = make_server(args.host, args.port, service, args.max_connections)
+    host, port = server.server_address[:2]
+    print(f"监听 http://{host}:{port}（{service.workers} 个实例），Ctrl+C 退出", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
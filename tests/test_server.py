@@ -0,0 +1,149 @@
+# test_server.py v13
+import http.client
+import io
+import json
+import os
+import socket
+import sys
+import threading
+import time
+import unittest
+import zipfile
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import server
+
+PASSWORD = "Abcdef12"
+
+def _png(width: int = 64, height: int = 48) -> tuple[bytes, np.ndarray]:
+    arr = np.random.default_rng(0).integers(0, 255, (height, width, 3), dtype=np.uint8)
+    buf = io.BytesIO()
+    Image.fromarray(arr).save(buf, format="PNG")
+    return buf.getvalue(), arr
+
+def _zip(members: dict[str, bytes]) -> bytes:
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+        for name, data in members.items():
+            zf.writestr(name, data)
+    return buf.getvalue()
+
+class ServerTest(unittest.TestCase):
+    """在本机回环地址上由系统分配端口启动服务，通过真实的 HTTP 连接测试"""
+
+    def start(self, workers: int = 1, max_connections: int = 8, **limits) -> server.CryptoService:
+        service = server.CryptoService(workers=workers, queue_timeout=0.5, **limits)
+        self.httpd = server.make_server("127.0.0.1", 0, service, max_connections)
+        self.port = self.httpd.server_address[1]
+        thread = threading.Thread(target=self.httpd.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(self.httpd.server_close)
+        self.addCleanup(self.httpd.shutdown)
+        return service
+
+    def post(self, path: str, body: bytes, headers: dict) -> tuple[int, dict, bytes]:
+        conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=10)
+        try:
+            conn.request("POST", path, body, headers)
+            resp = conn.getresponse()
+            return resp.status, dict(resp.getheaders()), resp.read()
+        finally:
+            conn.close()
+
+    def raw_request(self, head: str) -> bytes:
+        """只发送请求头（不发送请求体），返回服务端的响应"""
+        with socket.create_connection(("127.0.0.1", self.port), timeout=5) as sock:
+            sock.sendall(head.encode("ascii"))
+            return sock.recv(65536)
+
+    def test_round_trip(self):
+        self.start()
+        data, arr = _png()
+        status, headers, enc = self.post("/encrypt?name=a.png", data, {"X-Password": PASSWORD})
+        self.assertEqual(status, 200)
+        self.assertEqual(headers["X-Output-Name"], "a_enc.png")
+        status, headers, dec = self.post("/decrypt?name=a_enc.png", enc, {"X-Password": PASSWORD})
+        self.assertEqual(status, 200)
+        self.assertTrue((np.asarray(Image.open(io.BytesIO(dec))) == arr).all())
+
+    def test_wrong_password(self):
+        self.start()
+        data, _ = _png()
+        _, _, enc = self.post("/encrypt?name=a.png", data, {"X-Password": PASSWORD})
+        status, _, body = self.post("/decrypt?name=a_enc.png", enc, {"X-Password": "Zyxwvu98"})
+        self.assertEqual(status, 422)
+        self.assertIn("error", json.loads(body))
+
+    def test_batch_round_trip(self):
+        self.start()
+        data, arr = _png()
+        status, _, enc = self.post("/batch/encrypt?name=a.zip", _zip({"d/a.png": data}), {"X-Password": PASSWORD})
+        self.assertEqual(status, 200)
+        status, _, dec = self.post("/batch/decrypt?name=a.zip", enc, {"X-Password": PASSWORD})
+        self.assertEqual(status, 200)
+        with zipfile.ZipFile(io.BytesIO(dec)) as zf:
+            self.assertEqual(zf.namelist(), ["d/a.png"])
+            self.assertTrue((np.asarray(Image.open(io.BytesIO(zf.read("d/a.png")))) == arr).all())
+
+    def test_archive_size_limits(self):
+        service = self.start(max_member=1 << 20, max_unpacked=3 << 20)
+        # 高度可压缩的成员：请求体很小，解压后超过上限，按成员头中的大小直接拒绝
+        bomb = b"\0" * (2 << 20)
+        status, _, body = self.post("/batch/encrypt?name=a.zip", _zip({"a.png": bomb}), {"X-Password": PASSWORD})
+        self.assertEqual(status, 400)
+        self.assertIn("a.png", json.loads(body)["error"])
+        parts = {f"{i}.png": b"\0" * (900 << 10) for i in range(4)}
+        status, _, _ = self.post("/batch/encrypt?name=a.zip", _zip(parts), {"X-Password": PASSWORD})
+        self.assertEqual(status, 400)
+        self.assertEqual(service.budget.used, 0)
+
+    def test_bad_requests(self):
+        self.start()
+        data, _ = _png()
+        self.assertEqual(self.post("/nope", data, {"X-Password": PASSWORD})[0], 404)
+        self.assertEqual(self.post("/encrypt", data, {})[0], 400)
+        self.assertEqual(self.post("/encrypt", data, {"X-Password": "weak"})[0], 400)
+
+    def test_busy_rejected_before_body(self):
+        service = self.start()
+        with service.admit(0):
+            # 唯一的实例被占用：声明了请求体但一个字节也不发送，服务仍应在等待时限后返回 503
+            started = time.monotonic()
+            reply = self.raw_request(
+                "POST /encrypt?name=a.png HTTP/1.1\r\nHost: x\r\nX-Password: Abcdef12\r\n"
+                "Content-Length: 1000000\r\n\r\n")
+        self.assertTrue(reply.startswith(b"HTTP/1.1 503"), reply[:40])
+        self.assertIn(b"Retry-After", reply)
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertEqual(service.stats()["rejected"], 1)
+
+    def test_connection_limit(self):
+        self.start(max_connections=1)
+        idle = socket.create_connection(("127.0.0.1", self.port), timeout=5)
+        self.addCleanup(idle.close)
+        time.sleep(0.2)
+        # 超出上限的连接不创建处理线程，立即返回 503
+        reply = self.raw_request("GET /health HTTP/1.1\r\nHost: x\r\n\r\n")
+        self.assertTrue(reply.startswith(b"HTTP/1.1 503"), reply[:40])
+        idle.close()
+        time.sleep(0.2)
+        data, _ = _png()
+        status, _, _ = self.post("/encrypt?name=a.png", data, {"X-Password": PASSWORD})
+        self.assertEqual(status, 200)
+
+    def test_health(self):
+        self.start(workers=2)
+        conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=10)
+        conn.request("GET", "/health")
+        stats = json.loads(conn.getresponse().read())
+        conn.close()
+        self.assertEqual(stats["workers"], 2)
+        self.assertEqual(stats["idle"], 2)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,329 @@
+# tiled.py v13
+import os
+import shutil
+import struct
+import tempfile
+from typing import Callable, Optional
+import numpy as np
+from PIL import Image
+import config
+import pixel_shuffle
+
+# 按整字节存放像素的 rawmode 的每像素字节数；其余由大写通道字母数推得（RGB、BGRX、CMYK 等），
+# "1" 等按位打包或 YCbCr 等的布局不做流式处理
+_RAW_BYTES = {"L": 1, "P": 1, "I;16": 2, "I;16L": 2, "I;16B": 2, "I;32": 4, "I;32S": 4, "F;32F": 4}
+_IMAGE_DESCRIPTION = 0x010E
+
+def pixel_layout(mode: str) -> tuple[tuple, np.dtype]:
+    """不解码图片，推断某模式下像素数组的尾部形状与 dtype"""
+    sample = np.asarray(Image.new(mode, (1, 1)))
+    return sample.shape[2:], sample.dtype
+
+def estimate_nbytes(image: Image.Image) -> int:
+    """仅根据文件头中的尺寸与模式估算整幅像素数组的字节数"""
+    tail, dtype = pixel_layout(image.mode)
+    return image.width * image.height * int(np.prod(tail, dtype=np.int64)) * dtype.itemsize
+
+def read_array(image: Image.Image) -> np.ndarray:
+    """
+    将图片像素按行带复制到预分配的数组；np.asarray 会经 tobytes 先拼出整幅字节串，
+    峰值为解码图的三倍，按行带复制时只多出一个行带
+    """
+    width, height = image.size
+    tail, dtype = pixel_layout(image.mode)
+    out = np.empty((height, width) + tail, dtype=dtype)
+    row_bytes = max(1, width * int(np.prod(tail, dtype=np.int64)) * dtype.itemsize)
+    band = max(1, config.READ_BAND_BYTES // row_bytes)
+    for y0 in range(0, height, band):
+        y1 = min(y0 + band, height)
+        out[y0:y1] = np.asarray(image.crop((0, y0, width, y1)))
+    return out
+
+def _band_image(band: np.ndarray, mode: str) -> Image.Image:
+    """将一个行带数组转为指定模式的图片"""
+    if mode == '1':
+        return Image.fromarray(band)
+    band = np.ascontiguousarray(band)
+    return Image.frombuffer(mode, (band.shape[1], band.shape[0]), band, 'raw', mode, 0, 1)
+
+def _window(path: str, dtype: np.dtype, row_shape: tuple, start: int, stop: int,
+            mode: str) -> np.memmap:
+    """映射暂存文件中 [start, stop) 行；用完即释放，使常驻内存只包含当前行带"""
+    row_bytes = int(np.prod(row_shape, dtype=np.int64)) * dtype.itemsize
+    return np.memmap(path, dtype=dtype, mode=mode, offset=start * row_bytes,
+                     shape=(stop - start,) + row_shape)
+
+class _RawTile:
+    """文件中一段未压缩的像素：在图片中的区域、首个逻辑行的文件偏移与行跨度（自下而上存放时为负）"""
+
+    __slots__ = ("x0", "y0", "x1", "y1", "offset", "stride")
+
+    def __init__(self, x0: int, y0: int, x1: int, y1: int, offset: int, stride: int):
+        self.x0, self.y0, self.x1, self.y1 = x0, y0, x1, y1
+        self.offset = offset
+        self.stride = stride
+
+def raw_layout(image: Image.Image) -> Optional[tuple[int, list[_RawTile]]]:
+    """
+    未压缩的 TIFF（条带或分块）与 BMP 中像素在文件里的位置，返回 (每像素字节数, 区块列表)；
+    像素经过压缩、按位打包、分平面存放或图片不是从文件打开的时返回 None
+    """
+    path = getattr(image, "filename", None)
+    if not path or not image.tile or not os.path.isfile(path):
+        return None
+    file_size = os.path.getsize(path)
+    bpp = None
+    tiles = []
+    area = 0
+    for codec, (x0, y0, x1, y1), offset, args in image.tile:
+        if codec != "raw":
+            return None
+        rawmode, stride, orientation = (args, 0, 1) if isinstance(args, str) else (tuple(args) + (0, 1))[:3]
+        size = _RAW_BYTES.get(rawmode) or (len(rawmode) if rawmode.isalpha() and rawmode.isupper() else None)
+        if size is None or (bpp is not None and size != bpp):
+            return None
+        bpp = size
+        stride = stride or (x1 - x0) * bpp
+        if stride < (x1 - x0) * bpp or offset + (y1 - y0) * stride > file_size:
+            return None
+        if orientation < 0:
+            offset, stride = offset + (y1 - y0 - 1) * stride, -stride
+        tiles.append(_RawTile(x0, y0, x1, y1, offset, stride))
+        area += (x1 - x0) * (y1 - y0)
+    if area != image.width * image.height:
+        return None
+    return bpp, tiles
+
+def _tile_view(mm: np.ndarray, tile: _RawTile, bpp: int) -> np.ndarray:
+    """文件映射中一个区块的 (行, 列, 像素字节) 跨步视图"""
+    return np.ndarray((tile.y1 - tile.y0, tile.x1 - tile.x0, bpp), dtype=np.uint8, buffer=mm,
+                      offset=tile.offset, strides=(tile.stride, bpp, 1))
+
+def _merge(tiles: list[_RawTile], width: int, height: int) -> Optional[_RawTile]:
+    """各区块是首尾相接的整行条带（BMP、多数条带 TIFF）时合并为一个覆盖整幅图片的区块"""
+    tiles = sorted(tiles, key=lambda t: t.y0)
+    first = tiles[0]
+    y = 0
+    for t in tiles:
+        if (t.x0, t.x1, t.y0, t.stride) != (0, width, y, first.stride) or t.offset != first.offset + y * first.stride:
+            return None
+        y = t.y1
+    return _RawTile(0, 0, width, height, first.offset, first.stride)
+
+def _copy_band(mm: np.ndarray, tiles: list[_RawTile], bpp: int, y0: int, y1: int,
+               band: np.ndarray, store: bool = False):
+    """在文件映射与 [y0, y1) 行带之间复制像素：store=False 时从文件读入 band，否则将 band 写回文件"""
+    for t in tiles:
+        a, b = max(y0, t.y0), min(y1, t.y1)
+        if a >= b:
+            continue
+        view = _tile_view(mm, t, bpp)[a - t.y0:b - t.y0]
+        if store:
+            view[:] = band[a - y0:b - y0, t.x0:t.x1]
+        else:
+            band[a - y0:b - y0, t.x0:t.x1] = view
+
+def permute_file(image: Image.Image, layout: tuple[int, list[_RawTile]], rows: np.ndarray, cols: np.ndarray,
+                 budget: int = config.TILE_MEMORY_BUDGET,
+                 scratch_dir: str = config.TEMP_DIR, threads: int = 1,
+                 should_stop: Optional[Callable[[], bool]] = None) -> str:
+    """
+    未压缩 TIFF/BMP 的流式分带置换：直接在文件字节上按行带读写，不经 PIL 解码与编码，
+    峰值内存约为 budget，与图片尺寸无关。
+    输出先整体复制输入文件（文件头、调色板与行填充原样保留），再逐个行带 gather 后写回像素区；
+    像素按文件中的原始字节（如 BMP 的 BGR）整体搬移，解码结果与内存路径逐像素一致。
+    各区块能合并为一个跨步数组时直接从输入文件的映射中 gather，否则（分块 TIFF 等）先分带复制到行连续的暂存文件。
+    参数:
+        image: 已打开（尚未解码）的图片，会被关闭
+        layout: raw_layout 的返回值
+        其余参数同 permute_image
+    返回:
+        暂存目录中的结果文件路径，由调用方移走或删除
+    """
+    width, height = image.size
+    path = image.filename
+    image.close()
+    bpp, tiles = layout
+    row_bytes = width * bpp
+    # 每个行带同时存在被取到的源行与输出行两份
+    band = max(1, budget // (2 * row_bytes))
+    merged = _merge(tiles, width, height)
+    band_rows = rows
+    if merged is not None and merged.stride < 0:
+        # 自下而上存放（BMP）：按文件行序建立正跨步视图并换算行号；
+        # 负跨步视图不是 C 连续，np.take 会先复制整幅源数组
+        merged = _RawTile(0, 0, width, height, merged.offset + (height - 1) * merged.stride, -merged.stride)
+        band_rows = (height - 1) - rows
+
+    os.makedirs(scratch_dir, exist_ok=True)
+    out_fd, out_path = tempfile.mkstemp(suffix=os.path.splitext(path)[1], dir=scratch_dir)
+    os.close(out_fd)
+    src_path = None
+    try:
+        shutil.copyfile(path, out_path)
+        if merged is None:
+            src_fd, src_path = tempfile.mkstemp(suffix=".src", dir=scratch_dir)
+            os.ftruncate(src_fd, height * row_bytes)
+            os.close(src_fd)
+            for y0 in range(0, height, band):
+                pixel_shuffle.check_stop(should_stop)
+                y1 = min(y0 + band, height)
+                mm = np.memmap(path, dtype=np.uint8, mode='r')
+                win = _window(src_path, np.dtype(np.uint8), (width, bpp), y0, y1, 'r+')
+                _copy_band(mm, tiles, bpp, y0, y1, win)
+                win.flush()
+                del win, mm
+        buf = np.empty((min(band, height), width, bpp), dtype=np.uint8)
+        for y0 in range(0, height, band):
+            pixel_shuffle.check_stop(should_stop)
+            y1 = min(y0 + band, height)
+            # 映射每个行带重新建立、用完即释放，常驻内存只包含本行带取到的源行
+            if merged is not None:
+                mm = np.memmap(path, dtype=np.uint8, mode='r')
+                src = _tile_view(mm, merged, bpp)
+            else:
+                mm = src = np.memmap(src_path, dtype=np.uint8, mode='r', shape=(height, width, bpp))
+            out = pixel_shuffle.permute_array(src, band_rows[y0:y1], cols, out=buf[:y1 - y0], threads=threads,
+                                              should_stop=should_stop)
+            del src, mm
+            dst = np.memmap(out_path, dtype=np.uint8, mode='r+')
+            _copy_band(dst, tiles, bpp, y0, y1, out, store=True)
+            dst.flush()
+            del dst
+        return out_path
+    except BaseException:
+        os.remove(out_path)
+        raise
+    finally:
+        if src_path is not None:
+            try:
+                os.remove(src_path)
+            except OSError:
+                pass
+
+def set_tiff_description(path: str, text: Optional[str]):
+    """
+    改写 TIFF 首个 IFD 中的 ImageDescription（标签 270），text 为 None 时删除该标签。
+    新的 IFD 与字符串追加到文件末尾，再让文件头指向新 IFD；其余标签及像素数据的位置不变
+    """
+    with open(path, "r+b") as f:
+        head = f.read(16)
+        order = "<" if head[:2] == b"II" else ">"
+        big = struct.unpack(order + "H", head[2:4])[0] == 43
+        # 经典 TIFF 与 BigTIFF 的 IFD 偏移位置、偏移与条目数宽度、条目大小
+        ptr_at, off, num, entry_size = (8, "Q", "Q", 20) if big else (4, "I", "H", 12)
+        inline = struct.calcsize(off)
+        ifd = struct.unpack(order + off, head[ptr_at:ptr_at + inline])[0]
+        f.seek(ifd)
+        count = struct.unpack(order + num, f.read(struct.calcsize(num)))[0]
+        entries = [f.read(entry_size) for _ in range(count)]
+        next_ifd = f.read(inline)
+        entries = [e for e in entries if struct.unpack(order + "H", e[:2])[0] != _IMAGE_DESCRIPTION]
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        if text is not None:
+            data = text.encode("utf-8") + b"\0"
+            if len(data) <= inline:
+                value = data.ljust(inline, b"\0")
+            else:
+                end += end % 2
+                f.seek(end)
+                f.write(data)
+                value = struct.pack(order + off, end)
+                end += len(data)
+            entries.append(struct.pack(order + "HH" + off, _IMAGE_DESCRIPTION, 2, len(data)) + value)
+            entries.sort(key=lambda e: struct.unpack(order + "H", e[:2])[0])
+        end += -end % 8
+        f.seek(end)
+        f.write(struct.pack(order + num, len(entries)) + b"".join(entries) + next_ifd)
+        f.seek(ptr_at)
+        f.write(struct.pack(order + off, end))
+
+def move_file(path: str, fp):
+    """将结果文件移到目标路径，或复制到文件对象后删除"""
+    if isinstance(fp, str):
+        shutil.move(path, fp)
+        return
+    try:
+        with open(path, "rb") as f:
+            shutil.copyfileobj(f, fp, 1024 * 1024)
+    finally:
+        os.remove(path)
+
+def permute_image(image: Image.Image, rows: np.ndarray, cols: np.ndarray,
+                  budget: int = config.TILE_MEMORY_BUDGET,
+                  scratch_dir: str = config.TEMP_DIR, threads: int = 1,
+                  should_stop: Optional[Callable[[], bool]] = None) -> Image.Image:
+    """
+    超大图片的分带置换：out[i, j] = image[rows[i], cols[j]]，结果与内存路径逐字节一致
+    1. 将解码后的像素按行带写入内存映射暂存文件，随后关闭原图释放其解码内存；
+    2. 按行带从暂存文件取 rows 指定的行、再按 cols 取列，写入第二个暂存文件；
+    3. 按行带将结果粘贴到输出图片。
+    每个行带的映射用完即释放，峰值内存约为一幅解码图加上 budget：PNG、JPEG、压缩的 TIFF 等
+    只能由 PIL 整幅解码与编码，峰值仍随图片尺寸增长；未压缩的 TIFF/BMP 改用 permute_file，与尺寸无关。
+    参数:
+        image: 已打开（尚未解码）的图片，处理后会被关闭
+        rows, cols: 行、列置换
+        budget: 行带缓冲区的内存预算（字节）
+        scratch_dir: 暂存文件目录
+        threads: 每个行带 gather 的线程数，见 pixel_shuffle.permute_array
+        should_stop: 每个行带前及 gather 过程中检查，返回 True 时抛出 pixel_shuffle.Cancelled，暂存文件照常删除
+    返回:
+        置换后的图片
+    """
+    width, height = image.size
+    mode = image.mode
+    palette = image.getpalette() if mode == 'P' else None
+    transparency = image.info.get('transparency')
+    tail, dtype = pixel_layout(mode)
+    row_shape = (width,) + tail
+    row_bytes = max(1, width * int(np.prod(tail, dtype=np.int64)) * dtype.itemsize)
+    # 每个行带同时存在源行、输出行两份
+    band = max(1, budget // (2 * row_bytes))
+    total = height * row_bytes
+
+    os.makedirs(scratch_dir, exist_ok=True)
+    src_fd, src_path = tempfile.mkstemp(suffix=".src", dir=scratch_dir)
+    dst_fd, dst_path = tempfile.mkstemp(suffix=".dst", dir=scratch_dir)
+    try:
+        for fd in (src_fd, dst_fd):
+            os.ftruncate(fd, total)
+            os.close(fd)
+        # 1. 解码结果分带写入暂存文件
+        for y0 in range(0, height, band):
+            pixel_shuffle.check_stop(should_stop)
+            y1 = min(y0 + band, height)
+            win = _window(src_path, dtype, row_shape, y0, y1, 'r+')
+            win[:] = np.asarray(image.crop((0, y0, width, y1)))
+            win.flush()
+            del win
+        image.close()
+        # 2. 分带 gather：行置换 + 列置换
+        for y0 in range(0, height, band):
+            pixel_shuffle.check_stop(should_stop)
+            y1 = min(y0 + band, height)
+            src = np.memmap(src_path, dtype=dtype, mode='r', shape=(height,) + row_shape)
+            win = _window(dst_path, dtype, row_shape, y0, y1, 'r+')
+            pixel_shuffle.permute_array(src, rows[y0:y1], cols, out=win, threads=threads,
+                                        should_stop=should_stop)
+            win.flush()
+            del win, src
+        # 3. 分带组装输出图片
+        out = Image.new(mode, (width, height))
+        if palette is not None:
+            out.putpalette(palette)
+        if transparency is not None:
+            out.info['transparency'] = transparency
+        for y0 in range(0, height, band):
+            pixel_shuffle.check_stop(should_stop)
+            y1 = min(y0 + band, height)
+            win = _window(dst_path, dtype, row_shape, y0, y1, 'r')
+            out.paste(_band_image(win, mode), (0, y0))
+            del win
+        return out
+    finally:
+        for path in (src_path, dst_path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
@@ -56,5 +56,3 @@ def generate_secure_password(length: int = 16) -> str:
     password += [random.choice(chars) for _ in range(length - 3)]
     random.shuffle(password)
     return ''.join(password)
-
-setup_logging()
\ No newline at end of file